@@ -0,0 +1,327 @@
+""" Runs a batch of shell tasks on SLURM, dask, or local processes.
+
+`Batch` takes the same arguments as `slurmpy.sbatch.Batch` (ie. a
+command, a task list of positional arguments, shared keyword arguments,
+and SLURM resources) so that scripts can switch backends with a flag.
+Task `i` runs::
+
+    <func> <tasks[i]...> <kwargs...>
+
+* `slurm`: submits an sbatch array through `slurmpy`
+* `local`: runs tasks as local processes
+* `dask`: runs tasks on the workers of a dask cluster
+
+The `local` and `dask` backends read the SLURM resources: concurrency
+follows `cpus-per-task` and `mem-per-cpu` (or `mem`), each task is
+killed if its processes exceed that memory, and `time` is a timeout.
+
+Example::
+
+    batch = Batch('#!/bin/bash', 'julia script.jl', [('0',), ('1',)],
+                  ['--particles 10'], [], {'cpus-per-task' : '1',
+                                           'mem-per-cpu' : '2GB'},
+                  backend = 'local', outputs = ['out/0.csv', 'out/1.csv'])
+    batch.run()
+"""
+import os
+import re
+import sys
+import time
+import signal
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+BACKENDS = ['slurm', 'local', 'dask']
+
+# process groups of running commands, killed on interrupts
+_running = {}
+_lock = threading.Lock()
+_stopping = threading.Event()
+
+_units = {'K' : 1 << 10, 'M' : 1 << 20, 'G' : 1 << 30, 'T' : 1 << 40}
+
+def parse_memory(mem):
+    """ Bytes of a SLURM memory string (ie. `'2GB'`, `'300M'`) """
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(mem),
+                     flags = re.IGNORECASE)
+    if m is None:
+        raise ValueError('Unknown memory {0!r}'.format(mem))
+    # SLURM defaults to megabytes
+    unit = m.group(2).upper() or 'M'
+    return int(float(m.group(1)) * _units[unit])
+
+def parse_time(t):
+    """ Seconds of a SLURM time string (ie. `'40'`, `'0-6'`, `'1:30:00'`) """
+    days = 0
+    t = str(t)
+    if '-' in t:
+        d, t = t.split('-', 1)
+        days = int(d)
+        # `days-hours[:minutes[:seconds]]`
+        parts = [int(p) for p in t.split(':')]
+        parts += [0] * (3 - len(parts))
+    else:
+        # `minutes`, `minutes:seconds`, or `hours:minutes:seconds`
+        parts = [int(p) for p in t.split(':')]
+        parts = {1 : [0, parts[0], 0],
+                 2 : [0] + parts}.get(len(parts), parts)
+    h, m, s = parts
+    return ((days * 24 + h) * 60 + m) * 60 + s
+
+def task_resources(resources):
+    """ Cores, memory (bytes or `None`), and timeout (s or `None`) of a task """
+    cpus = int(resources.get('cpus-per-task', 1))
+    memory = None
+    if 'mem' in resources:
+        memory = parse_memory(resources['mem'])
+    elif 'mem-per-cpu' in resources:
+        memory = parse_memory(resources['mem-per-cpu']) * cpus
+    timeout = None
+    if 'time' in resources:
+        timeout = parse_time(resources['time'])
+    return cpus, memory, timeout
+
+def local_slots(cpus, memory = None):
+    """ Number of tasks that fit in the available cores and memory """
+    slots = len(os.sched_getaffinity(0)) // cpus
+    if not memory is None:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        slots = min(slots, total // memory)
+    return max(1, slots)
+
+def _group_rss(pgid):
+    """ Resident memory (bytes) of the processes in a group """
+    page = os.sysconf('SC_PAGE_SIZE')
+    rss = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/{0!s}/stat'.format(pid), 'r') as f:
+                # fields after the command name, which may contain spaces
+                stat = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(stat[2]) == pgid:
+            rss += int(stat[21]) * page
+    return rss
+
+def run_command(cmd, cpus = 1, memory = None, timeout = None, poll = 1.):
+    """ Runs a shell command, enforcing a memory limit and timeout.
+
+    The command runs in its own process group, which is killed if its
+    resident memory exceeds `memory` or it runs past `timeout`.
+
+    Returns
+        The duration of the command (s)
+    """
+    env = dict(os.environ)
+    cpus = str(cpus)
+    env.update({'SLURM_CPUS_PER_TASK' : cpus, 'OMP_NUM_THREADS' : cpus,
+                'JULIA_NUM_THREADS' : cpus})
+    t_0 = time.time()
+    with _lock:
+        if _stopping.is_set():
+            raise RuntimeError('cancelled')
+        proc = subprocess.Popen(cmd, shell = True, executable = '/bin/bash',
+                                start_new_session = True, env = env)
+        _running[proc.pid] = proc
+    reason = None
+    try:
+        while reason is None:
+            try:
+                proc.wait(timeout = poll)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if not timeout is None and time.time() - t_0 > timeout:
+                reason = 'timed out after {0:d}s'.format(timeout)
+            elif not memory is None and _group_rss(proc.pid) > memory:
+                reason = 'exceeded {0:d}MB'.format(memory >> 20)
+    finally:
+        if proc.returncode is None:
+            _killpg(proc)
+        with _lock:
+            del _running[proc.pid]
+    if not reason is None:
+        raise RuntimeError(reason)
+    if proc.returncode != 0:
+        raise RuntimeError('exit status {0:d}'.format(proc.returncode))
+    return time.time() - t_0
+
+def _killpg(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+def _resume():
+    _stopping.clear()
+
+def kill_running():
+    """ Kills the commands running in this process and any not started """
+    _stopping.set()
+    with _lock:
+        procs = list(_running.values())
+    for proc in procs:
+        _killpg(proc)
+
+class Batch:
+
+    """
+    A batch of tasks sharing a command, arguments, and resources.
+
+    :param interpreter: Shebang of the SLURM job file
+    :param func: Command run for each task
+    :param tasks: A list of tuples of positional arguments
+    :param kwargs: A list of arguments shared by each task
+    :param extras: Extra lines of the SLURM job file
+    :param resources: SLURM resources (ie. `cpus-per-task`, `mem-per-cpu`)
+    :param backend: One of `BACKENDS`
+    :param outputs: Output path of each task. Tasks whose output exists
+        are skipped.
+    """
+
+    def __init__(self, interpreter, func, tasks, kwargs, extras, resources,
+                 backend = 'slurm', outputs = None):
+        if not backend in BACKENDS:
+            raise ValueError('Unknown backend {0!r}'.format(backend))
+        if not outputs is None and len(outputs) != len(tasks):
+            raise ValueError('Expected an output per task')
+        self.interpreter = interpreter
+        self.func = func
+        self.tasks = list(tasks)
+        self.kwargs = list(kwargs)
+        self.extras = list(extras)
+        self.resources = resources
+        self.backend = backend
+        self.outputs = outputs
+
+    def pending(self):
+        """ Tasks whose output does not exist yet """
+        if self.outputs is None:
+            return self.tasks
+        return [t for t, o in zip(self.tasks, self.outputs)
+                if not os.path.exists(o)]
+
+    def command(self, task):
+        """ The shell command of a task """
+        return ' '.join([self.func, *map(str, task), *self.kwargs])
+
+    def _sbatch(self, tasks):
+        from slurmpy import sbatch
+        return sbatch.Batch(self.interpreter, self.func, tasks, self.kwargs,
+                            self.extras, self.resources)
+
+    def job_file(self, chunk = 1):
+        """ The SLURM job file, or the first command on other backends """
+        tasks = self.pending()
+        if self.backend == 'slurm':
+            return self._sbatch(tasks).job_file(chunk = chunk)
+        lines = [self.interpreter]
+        if tasks:
+            lines.append(self.command(tasks[0]))
+        return lines
+
+    def run(self, n = None, check_submission = True, workers = None,
+            address = None):
+        """ Runs the pending tasks.
+
+        Arguments:
+            n (int, optional): Size of the SLURM array (`slurm`)
+            workers (int, optional): Most concurrent tasks (`local`,
+                `dask`). Defaults to as many as fit in the machine.
+            address (str, optional): Scheduler of an existing dask
+                cluster (`dask`)
+        Returns
+            A dictionary of `done`, `failed`, and `skipped` tasks, or
+            `None` for `slurm`
+        """
+        tasks = self.pending()
+        skipped = [t for t in self.tasks if not t in tasks]
+        if skipped:
+            print('Skipping {0:d} tasks with outputs'.format(len(skipped)))
+        if not tasks:
+            return {'done' : [], 'failed' : [], 'skipped' : skipped}
+
+        if self.backend == 'slurm':
+            n = len(tasks) if n is None else min(n, len(tasks))
+            self._sbatch(tasks).run(n = n,
+                                    check_submission = check_submission)
+            return None
+
+        cpus, memory, timeout = task_resources(self.resources)
+        slots = local_slots(cpus, memory)
+        if not workers is None:
+            slots = min(slots, workers)
+        cmds = {self.command(t) : t for t in tasks}
+        args = dict(cpus = cpus, memory = memory, timeout = timeout)
+        print('Running {0:d} tasks on {1:d} {2!s} workers'.format(
+            len(cmds), slots, self.backend))
+        sys.stdout.flush()
+        if self.backend == 'local':
+            _resume()
+            pool = ThreadPoolExecutor(max_workers = slots)
+            futures = {}
+            try:
+                futures = {pool.submit(run_command, c, **args) : c
+                           for c in cmds}
+                result = _collect(futures, as_completed(futures))
+            except BaseException:
+                # ie. Ctrl-C; don't leave the process groups behind
+                for f in futures:
+                    f.cancel()
+                kill_running()
+                raise
+            finally:
+                pool.shutdown()
+        else:
+            import distributed
+            if address is None:
+                cluster = distributed.LocalCluster(n_workers = slots,
+                                                   threads_per_worker = 1,
+                                                   processes = True,
+                                                   memory_limit = 0)
+                client = distributed.Client(cluster)
+            else:
+                client = distributed.Client(address)
+                client.upload_file(os.path.abspath(__file__))
+            futures = {}
+            try:
+                client.run(_resume)
+                futures = client.map(run_command, list(cmds), pure = False,
+                                     **args)
+                futures = dict(zip(futures, cmds))
+                result = _collect(futures, distributed.as_completed(futures))
+            except BaseException:
+                client.cancel(list(futures))
+                client.run(kill_running)
+                raise
+            finally:
+                client.close()
+        result = {k : [cmds[c] for c in v] for k, v in result.items()}
+        result['skipped'] = skipped
+        return result
+
+def _collect(futures, completed):
+    """ Prints the progress of command futures as they complete """
+    done, failed = [], []
+    t_0 = time.time()
+    for f in completed:
+        cmd = futures[f]
+        try:
+            dur = f.result()
+        except Exception as e:
+            print('Failed {0!s}: {1!s}'.format(cmd, e))
+            failed.append(cmd)
+            continue
+        done.append(cmd)
+        msg = '[{0:d}/{1:d}] took {2:.1f}s ({3:.2f} tasks/min)'
+        print(msg.format(len(done), len(futures), dur,
+                         60 * len(done) / (time.time() - t_0)))
+        sys.stdout.flush()
+    print('Completed {0:d} tasks ({1:d} failed) in {2:.1f}s'.format(
+        len(done), len(failed), time.time() - t_0))
+    return {'done' : done, 'failed' : failed}
@@ -4,7 +4,8 @@
 
 import os
 import argparse
-from slurmpy import sbatch
+
+import executor
 
 from galileo_ramp.exp1_dataset import Exp1Dataset
 
@@ -26,11 +27,19 @@ def main():
     parser.add_argument('--chains', type = int,
                         default = 1,
                         help = 'Number of chains')
+    parser.add_argument('--restart', action = 'store_true',
+                        help = 'Rerun trials with existing results')
+    parser.add_argument('--backend', type = str, default = 'slurm',
+                        choices = executor.BACKENDS,
+                        help = 'Where to run trials')
+    parser.add_argument('--workers', type = int,
+                        help = 'Most concurrent trials (local and dask)')
     args = parser.parse_args()
 
+    # the same noise string names the out dir and is passed to julia
+    noise = repr(args.obs_noise)
     # create out dir early to prevent conflicts
-    out_path = '/traces/exp1_p_{0:d}_n_{1:.2f}'.format(args.particles, 
-                                                       args.obs_noise)
+    out_path = '/traces/exp1_p_{0:d}_n_{1!s}'.format(args.particles, noise)
     os.path.isdir(out_path) or os.mkdir(out_path)
 
 
@@ -41,8 +50,14 @@ def main():
     njobs = 120
 
     tasks = [(str(i),) for i in range(njobs)]
+    # resume by skipping completed trials
+    outputs = None
+    if not args.restart:
+        outputs = [os.path.join(out_path, '{0:d}.csv'.format(i))
+                   for i in range(njobs)]
     kwargs = ['--particles {0:d}'.format(args.particles),
-              '--obs_noise {0:f}'.format(args.obs_noise),
+              '--obs_noise {0!s}'.format(noise),
+              '--out_dir {0!s}'.format(out_path),
               '--chains {0:d}'.format(args.chains)]
 
     interpreter = '#!/bin/bash'
@@ -60,11 +75,12 @@ def main():
     func = func.format(os.getcwd(), path)
     # func = 'bash {0!s}/run.sh julia --sysimage {1!s} {2!s}'
     # func = func.format(os.getcwd(), sys_img, path)
-    batch = sbatch.Batch(interpreter, func, tasks, kwargs, extras,
-                         resources)
+    batch = executor.Batch(interpreter, func, tasks, kwargs, extras,
+                           resources, backend = args.backend,
+                           outputs = outputs)
     print("Template Job:")
     print('\n'.join(batch.job_file(chunk=njobs)))
-    batch.run(n = njobs, check_submission = True)
+    batch.run(n = njobs, check_submission = True, workers = args.workers)
 
 if __name__ == '__main__':
    main()
@@ -3,65 +3,316 @@
 import os
 import sys
 import dask
+import shutil
+import argparse
 import numpy as np
 from multiprocessing import set_executable
-from bayes_opt import BayesianOptimization
+from bayes_opt import BayesianOptimization, UtilityFunction
 from bayes_opt.logger import JSONLogger
 from bayes_opt.event import Events
+from bayes_opt.util import NotUniqueError
 
 
 import distributed
 from dask_jobqueue import SLURMCluster
 
+from result_cache import ResultCache, cache_key, code_version, \
+    file_digest
+
 
 # path to trial dataset
 dataset = "/databases/exp1.hdf5"
 # path to human responses
 responses = "/databases/exp1_avg_human_responses.csv"
 
-INIT_JULIA = True
+class JuliaRuntime(distributed.WorkerPlugin):
+
+    """
+    Initializes the Julia runtime once per dask worker.
+
+    The inference module is compiled with a small evaluation so that
+    tasks only pay for inference. The runtime is kept on the worker
+    as `worker.galileo`.
+    """
+
+    name = 'galileo-julia'
+
+    def __init__(self, warmup = True, init = True):
+        self.warmup = warmup
+        self.init = init
+
+    def setup(self, worker):
+        import galileo_ramp.execute
+        gr = galileo_ramp.execute.initialize(self.init)
+        if self.warmup:
+            # JIT the inference and load the dataset
+            gr.evaluation(0.1, 2, dataset, trials[0], reps = 1)
+        worker.galileo = gr
+
+def runtime():
+    """ Returns the Julia runtime of the current worker """
+    try:
+        worker = distributed.get_worker()
+    except ValueError:
+        worker = None
+    if worker is None or not hasattr(worker, 'galileo'):
+        # outside of a worker (ie. a local run)
+        import galileo_ramp.execute
+        return galileo_ramp.execute.initialize()
+    return worker.galileo
+
+def cache_version():
+    """ Dataset digest and code version of cached results.
+
+    Computed once on the client, which is the only process that reads
+    or writes the cache.
+    """
+    return {'dataset' : file_digest(dataset), 'code' : code_version()}
 
-def eval_trial(obs_noise, particles, trial, reps):
-    """ Runs inference for a given trial"""
-    # load julia modules for worker
-    import galileo_ramp.execute
-    gr = galileo_ramp.execute.initialize(INIT_JULIA)
+def trial_seed(seed, obs_noise, particles, trial, reps):
+    """ Seed of a trial evaluation, derived from a base `seed` """
+    key = cache_key(seed = seed, trial = trial, obs_noise = obs_noise,
+                    particles = particles, reps = reps)
+    return int(key[:8], 16)
+
+def eval_trial(obs_noise, particles, trial, reps, seed = None):
+    """ Runs inference for a given trial
+
+    Arguments:
+        seed (int, optional): Seeds julia's global RNG first
+    """
+    gr = runtime()
+    if not seed is None:
+        from julia import Random
+        Random.seed_b(seed)
     return gr.evaluation(obs_noise, particles, dataset, trial, reps = reps)
 
 def merge(results):
     """ Merges inference runs and returns RMSE """
-    import galileo_ramp.execute
-    gr = galileo_ramp.execute.initialize(INIT_JULIA)
+    gr = runtime()
     return gr.merge_evaluation(results, responses)
 
 
 trials = list(range(120))
 # trials = [0,1,2,3]
 
-def f(obs_noise, particles, client, reps):
+def score(results):
+    """ Negative RMSE of merged inference runs """
+    return merge(results) * -1.0
+
+def _store(cache, key, fields):
+    """ Callback storing the result of a finished future in `cache` """
+    def store(future):
+        if future.status == 'finished':
+            cache.put(key, future.result(), fields)
+    return store
+
+def submit(obs_noise, particles, client, reps, subset = None, cache = None,
+           version = None, seed = None):
+    """ Submits the evaluation of every trial and their merge.
+
+    Cached trials are read on the client and new results are stored
+    from the client as they complete.
+
+    Arguments:
+        subset (list, optional): Evaluate only these trials
+        cache (ResultCache, optional): Results of previous evaluations
+        version (dict, optional): `cache_version()` of the results
+        seed (int, optional): Base seed of the evaluations (see
+            `trial_seed`)
+    Returns
+        A future of the negative RMSE
+    """
+    if not cache is None and version is None:
+        version = cache_version()
+    tasks = []
+    for t in (trials if subset is None else subset):
+        s = None if seed is None else \
+            trial_seed(seed, obs_noise, particles, t, reps)
+        if cache is None:
+            tasks.append(client.submit(eval_trial, obs_noise, particles, t,
+                                       reps, s, pure = False))
+            continue
+        fields = {'trial' : t, 'obs_noise' : obs_noise,
+                  'particles' : particles, 'reps' : reps, 'seed' : s}
+        fields.update(version)
+        key = cache_key(**fields)
+        result = cache.get(key)
+        if result is None:
+            result = client.submit(eval_trial, obs_noise, particles, t,
+                                   reps, s, pure = False)
+            result.add_done_callback(_store(cache, key, fields))
+        tasks.append(result)
+    return client.submit(score, tasks, pure = False)
+
+def f(obs_noise, particles, client, reps, cache = None, version = None,
+      seed = None):
     """ The black box function that returns RMSE """
-    g = lambda t: eval_trial(obs_noise, particles, t, reps)
-    tasks = client.map(g, trials, pure = False)
-    results = client.gather(tasks)
-    deviance = client.submit(merge, results)
-    return deviance.result() * -1.0
-
-def initialize_dask(n):
-
-    slurm = n > 1
-   
-    if not slurm:
-        # must initialize julia globalyy
+    return submit(obs_noise, particles, client, reps, cache = cache,
+                  version = version, seed = seed).result()
+
+def suggest(optimizer, pbounds, utility, pending, init_points):
+    """ Suggests a point while others are still being evaluated.
+
+    Pending points are registered with the worst observed target
+    ("constant liar") in a copy of the GP so that concurrent suggestions
+    spread out. The first `init_points` are random.
+    """
+    n = len(optimizer.res) + len(pending)
+    if n < init_points or not optimizer.res:
+        space = optimizer.space
+        return space.array_to_params(space.random_sample())
+    liar = BayesianOptimization(f = None, pbounds = pbounds,
+                                random_state = n, verbose = 0)
+    for res in optimizer.res:
+        liar.register(params = res['params'], target = res['target'])
+    lie = min(res['target'] for res in optimizer.res)
+    for params in pending:
+        try:
+            liar.register(params = params, target = lie)
+        except NotUniqueError:
+            # already observed
+            pass
+    return liar.suggest(utility)
+
+def async_maximize(optimizer, pbounds, evaluate, batch = 4, init_points = 2,
+                   n_iter = 10, utility = None):
+    """ Maximizes with up to `batch` evaluations in flight.
+
+    Each result is registered as soon as it completes (triggering
+    `Events.OPTIMIZATION_STEP`) and a new point is submitted in its place.
+
+    Arguments:
+        evaluate (callable): Maps parameters to a future of the target
+    """
+    if utility is None:
+        utility = UtilityFunction(kind = 'ucb', kappa = 2.576, xi = 0.0)
+    total = init_points + n_iter
+    pending = {}
+    running = distributed.as_completed()
+    submitted = 0
+    while submitted < total or pending:
+        while submitted < total and len(pending) < batch:
+            params = suggest(optimizer, pbounds, utility,
+                             list(pending.values()), init_points)
+            future = evaluate(params)
+            pending[future] = params
+            running.add(future)
+            submitted += 1
+        future = next(running)
+        params = pending.pop(future)
+        try:
+            optimizer.register(params = params, target = future.result())
+        except NotUniqueError:
+            print('Skipping duplicate point {0!s}'.format(params))
+        print('[{0:d}/{1:d}] {2!s}'.format(len(optimizer.res), total,
+                                           optimizer.max))
+
+def stratified_trials(n):
+    """ About `n` trials, taking both versions of evenly spaced pairs """
+    pairs = np.unique(np.linspace(0, len(trials) // 2 - 1,
+                                  max(1, n // 2)).round().astype(int))
+    return [trials[2 * p + v] for p in pairs for v in range(2)]
+
+def fidelity(rung, n_rungs, eta, reps, particles):
+    """ Budget of a rung; the last rung is the full objective.
+
+    Each rung below shrinks the number of trials, repetitions, and
+    particles (if given) by a factor of `eta`.
+    """
+    shrink = eta ** (n_rungs - 1 - rung)
+    budget = {'subset' : None, 'reps' : max(1, int(round(reps / shrink))),
+              'particles' : None}
+    if shrink > 1:
+        budget['subset'] = stratified_trials(int(len(trials) / shrink))
+    if not particles is None:
+        budget['particles'] = max(1, int(particles / shrink))
+    return budget
+
+def successive_halving(configs, evaluate, start, n_rungs, eta, reps,
+                       particles = None):
+    """ Keeps the best `1 / eta` of the configurations at each rung.
+
+    All configurations of a rung are evaluated concurrently.
+
+    Arguments:
+        configs (list): Parameter dictionaries
+        evaluate (callable): Maps parameters and a `fidelity` budget to
+            a future of the target
+        start (int): First rung
+    Returns
+        The configurations that reached the last rung and their targets
+    """
+    for rung in range(start, n_rungs):
+        budget = fidelity(rung, n_rungs, eta, reps, particles)
+        futures = [evaluate(c, budget) for c in configs]
+        targets = [fut.result() for fut in futures]
+        msg = 'Rung {0:d}: {1:d} configurations on {2!s} trials, {3:d} reps'
+        n_trials = len(trials if budget['subset'] is None
+                       else budget['subset'])
+        print(msg.format(rung, len(configs), n_trials, budget['reps']))
+        if rung == n_rungs - 1:
+            return configs, targets
+        keep = max(1, len(configs) // eta)
+        order = np.argsort(targets)[::-1][:keep]
+        configs = [configs[i] for i in order]
+
+def hyperband(optimizer, evaluate, n_rungs = 3, eta = 3, reps = 5,
+              particles = None):
+    """ Runs a Hyperband sweep of random configurations.
+
+    Only full fidelity results are registered with the optimizer (and so
+    reach its loggers).
+    """
+    s_max = n_rungs - 1
+    for s in range(s_max, -1, -1):
+        n = int(np.ceil((s_max + 1) / (s + 1) * eta ** s))
+        space = optimizer.space
+        configs = [space.array_to_params(space.random_sample())
+                   for _ in range(n)]
+        configs, targets = successive_halving(configs, evaluate, s_max - s,
+                                              n_rungs, eta, reps, particles)
+        for c, t in zip(configs, targets):
+            try:
+                optimizer.register(params = c, target = t)
+            except NotUniqueError:
+                print('Skipping duplicate point {0!s}'.format(c))
+        print('Bracket {0:d}: {1!s}'.format(s, optimizer.max))
+
+def initialize_dask(n, local = False, warmup = True, in_process = False,
+                    python = 'python-jl'):
+    """ Starts a cluster with a warm Julia runtime on each worker.
+
+    Arguments:
+        n (int): Number of workers
+        local (bool): Use a local cluster instead of SLURM. The cluster
+            has at most a worker per available core.
+        in_process (bool): Run a single local worker in this process
+        python (str): Interpreter of local worker processes. A statically
+            linked python can only load julia through `python-jl`.
+    """
+
+    plugin = JuliaRuntime(warmup)
+    if local and in_process:
+        # julia must be initialized globally, from the main thread
         import galileo_ramp.execute
         galileo_ramp.execute.initialize()
-        global INIT_JULIA
-        INIT_JULIA = False
-        cores =  len(os.sched_getaffinity(0))
+        plugin = JuliaRuntime(warmup, init = False)
         cluster = distributed.LocalCluster(n_workers = 1,
                                            threads_per_worker = 1,
-                                           processes = False,
-        )
-                                           # python = "python-jl")
+                                           processes = False)
+    elif local:
+        exe = shutil.which(python)
+        if exe is None:
+            msg = 'Cannot find {0!s}; use --in_process or --python'
+            raise ValueError(msg.format(python))
+        # workers are spawned through `multiprocessing`
+        set_executable(exe)
+        cores =  len(os.sched_getaffinity(0))
+        # julia is not thread safe; one single-threaded process per worker
+        cluster = distributed.LocalCluster(n_workers = min(n, cores),
+                                           threads_per_worker = 1,
+                                           processes = True)
 
     else:
         n = min(500, n)
@@ -96,37 +347,93 @@ def initialize_dask(n):
         cluster.scale(n)
 
     print(cluster.dashboard_link)
-    return distributed.Client(cluster)
+    client = distributed.Client(cluster)
+    client.register_plugin(plugin)
+    return client
 
 def main():
-    client = initialize_dask(len(trials))
+    parser = argparse.ArgumentParser(
+        description = 'Bayesian optimization of the Exp1 particle filter',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--local', action = 'store_true',
+                        help = 'Run on a local cluster instead of SLURM')
+    parser.add_argument('--in_process', action = 'store_true',
+                        help = 'Run a single worker in this process ' +\
+                        '(with --local)')
+    parser.add_argument('--python', type = str, default = 'python-jl',
+                        help = 'Interpreter of local workers')
+    parser.add_argument('--workers', type = int, default = len(trials),
+                        help = 'Number of workers')
+    parser.add_argument('--batch', type = int, default = 4,
+                        help = 'Number of points evaluated concurrently')
+    parser.add_argument('--init_points', type = int, default = 2,
+                        help = 'Number of random points')
+    parser.add_argument('--n_iter', type = int, default = 10,
+                        help = 'Number of suggested points')
+    parser.add_argument('--particles', type = int, nargs = 2,
+                        help = 'Also search particle counts in this range')
+    parser.add_argument('--fidelity', type = str, default = 'full',
+                        choices = ['full', 'hyperband'],
+                        help = 'Evaluate every point on all trials or ' +\
+                        'run Hyperband over trials, reps, and particles')
+    parser.add_argument('--rungs', type = int, default = 3,
+                        help = 'Number of Hyperband fidelities')
+    parser.add_argument('--eta', type = int, default = 3,
+                        help = 'Hyperband reduction factor')
+    parser.add_argument('--cache', type = str,
+                        default = '/traces/exp1_pf_cache.sqlite',
+                        help = 'Result cache shared across runs ' +\
+                        '(only opened by this process)')
+    parser.add_argument('--no_cache', action = 'store_true',
+                        help = 'Recompute every trial')
+    parser.add_argument('--seed', type = int, default = 0,
+                        help = 'Base seed of trial evaluations. Runs ' +\
+                        'with another seed are cached as new repeats.')
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else ResultCache(args.cache)
+    version = None if cache is None else cache_version()
+    client = initialize_dask(args.workers, local = args.local,
+                             in_process = args.in_process,
+                             python = args.python)
 
     reps = 5
-    # run function once for julia JIT
-    f(0.1, 2, client, 1)
 
     # partial application of fitness function
-    def black_box(obs_noise = 0.1, particles = 100):
-        return f(obs_noise, int(particles), client, reps)
+    def evaluate(params):
+        return submit(params['obs_noise'], int(params.get('particles', 100)),
+                      client, reps, cache = cache, version = version,
+                      seed = args.seed)
 
     # Bounded region of parameter space
     pbounds = {
         'obs_noise': (0.001, 0.05),
-        # 'particles': (1, 100),
     }
+    if not args.particles is None:
+        pbounds['particles'] = tuple(args.particles)
     optimizer = BayesianOptimization(
-        f=black_box,
+        f=None,
         pbounds=pbounds,
         verbose=2,
         random_state=1)
 
     logger = JSONLogger(path="/traces/exp1_pf_bo_logs.json")
     optimizer.subscribe(Events.OPTIMIZATION_STEP, logger)
-    
-    optimizer.maximize(
-        init_points=2,
-        n_iter=10,
-    )
+
+    if args.fidelity == 'full':
+        async_maximize(optimizer, pbounds, evaluate, batch = args.batch,
+                       init_points = args.init_points, n_iter = args.n_iter)
+    else:
+        # particle counts are a fidelity unless they are searched
+        particles = 100 if args.particles is None else None
+        def evaluate_budget(params, budget):
+            n = budget['particles'] or int(params.get('particles', 100))
+            return submit(params['obs_noise'], n, client, budget['reps'],
+                          subset = budget['subset'], cache = cache,
+                          version = version, seed = args.seed)
+        hyperband(optimizer, evaluate_budget, args.rungs, args.eta, reps,
+                  particles)
     client.close()
 
 if __name__ == "__main__":
@@ -10,15 +10,17 @@ from pprint import pprint
 from itertools import repeat
 
 import numpy as np
-from slurmpy import sbatch
 from galileo_ramp.utils import config
 
+import executor
+
 CONFIG = config.Config()
 
 root = CONFIG['PATHS', 'root']
 
 
-def submit_sbatch(trials, script, chains, size = 1000):
+def submit_sbatch(trials, script, chains, size = 1000, backend = 'slurm',
+                  workers = None):
 
     njobs = min(size, len(trials))
     duration = 30 * chains
@@ -38,11 +40,11 @@ def submit_sbatch(trials, script, chains, size = 1000):
         'requeue' : None,
         'output' : os.path.join(CONFIG['PATHS', 'sout'], 'slurm-%A_%a.out')
     }
-    batch = sbatch.Batch(interpreter, func, tasks, kargs, extras,
-                         resources)
+    batch = executor.Batch(interpreter, func, tasks, kargs, extras,
+                           resources, backend = backend)
     print("Template Job:")
     print('\n'.join(batch.job_file(chunk=njobs)))
-    batch.run(n = njobs, check_submission = False)
+    batch.run(n = njobs, check_submission = False, workers = workers)
 
 
 def main():
@@ -58,6 +60,11 @@ def main():
                         help = 'inference procedure to apply')
     parser.add_argument('--chains', type = int, default = 10,
                         help = 'number of chains')
+    parser.add_argument('--backend', type = str, default = 'slurm',
+                        choices = executor.BACKENDS,
+                        help = 'where to run trials')
+    parser.add_argument('--workers', type = int,
+                        help = 'most concurrent trials (local and dask)')
 
     args = parser.parse_args()
 
@@ -72,7 +79,8 @@ def main():
     else:
         script = os.path.join(root, 'scripts', 'validation',
                               'match_legacy_dynamics.py')
-    submit_sbatch(trials, script, args.chains)
+    submit_sbatch(trials, script, args.chains, backend = args.backend,
+                  workers = args.workers)
 
 if __name__ == '__main__':
     main()
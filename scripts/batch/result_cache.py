@@ -0,0 +1,157 @@
+""" Content-addressed store of inference results.
+
+Results are keyed on a hash of everything that determines them (ie.
+the dataset digest, trial, parameters, seed, and code version) and kept
+in a single SQLite file, so that requeued jobs and overlapping sweeps
+reuse finished runs.
+
+Example::
+
+    cache = ResultCache('/traces/exp1_pf_cache.sqlite')
+    key = cache_key(dataset = file_digest(dataset), trial = 3,
+                    obs_noise = 0.01, particles = 100, reps = 5,
+                    seed = None, code = code_version())
+    result = cache.get(key)
+    if result is None:
+        result = run(...)
+        cache.put(key, result)
+
+SQLite locking is unreliable on network file systems; keep the cache
+on a local or otherwise lock-safe disk, or only open it from a single
+process (ie. the client of a dask cluster, see `exp1_pf_bo.py`).
+"""
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import argparse
+import functools
+import subprocess
+
+_digests = {}
+
+def file_digest(path, block = 1 << 20):
+    """ sha256 of a file, memoized on its path, size, and mtime """
+    st = os.stat(path)
+    k = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if not k in _digests:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(block), b''):
+                h.update(chunk)
+        _digests[k] = h.hexdigest()
+    return _digests[k]
+
+@functools.lru_cache(maxsize = None)
+def code_version(root = None):
+    """ The git commit of `root` (`-dirty` if modified) or 'unknown' """
+    if root is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty',
+                              '--abbrev=40'],
+                             cwd = root, check = True,
+                             stdout = subprocess.PIPE,
+                             stderr = subprocess.DEVNULL)
+        return out.stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def cache_key(**fields):
+    """ Hash of the canonical json of `fields` """
+    blob = json.dumps(fields, sort_keys = True, default = str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+class ResultCache:
+
+    """
+    A SQLite table of pickled results by key.
+
+    :param path: Path to the database (created if missing)
+    :param timeout: Seconds to wait on a locked database
+    """
+
+    def __init__(self, path, timeout = 60.):
+        self.path = path
+        self.timeout = timeout
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS results (' +
+                       'key TEXT PRIMARY KEY, fields TEXT, ' +
+                       'value BLOB, created REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout = self.timeout)
+
+    def get(self, key):
+        """ Returns the result stored under `key` or `None` """
+        db = self._connect()
+        try:
+            row = db.execute('SELECT value FROM results WHERE key = ?',
+                             (key,)).fetchone()
+        finally:
+            db.close()
+        return None if row is None else pickle.loads(row[0])
+
+    def put(self, key, value, fields = None):
+        """ Stores `value` under `key` in a single transaction.
+
+        The first result stored under a key is kept.
+        """
+        blob = pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL)
+        meta = None if fields is None else json.dumps(fields, default = str)
+        db = self._connect()
+        try:
+            with db:
+                db.execute('INSERT OR IGNORE INTO results VALUES ' +
+                           '(?, ?, ?, ?)', (key, meta, blob, time.time()))
+        finally:
+            db.close()
+
+    def __len__(self):
+        db = self._connect()
+        try:
+            return db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        finally:
+            db.close()
+
+def cached(cache, fields, func, *args, **kwargs):
+    """ Returns `func(*args, **kwargs)`, stored in `cache` under `fields`.
+
+    `cache` may be `None` or a path, in which case nothing is cached.
+    """
+    if cache is None:
+        return func(*args, **kwargs)
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    key = cache_key(**fields)
+    result = cache.get(key)
+    if result is None:
+        result = func(*args, **kwargs)
+        cache.put(key, result, fields)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = 'Summarizes a result cache',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('path', type = str, help = 'Path to the cache')
+    args = parser.parse_args()
+    cache = ResultCache(args.path)
+    db = cache._connect()
+    try:
+        rows = db.execute('SELECT fields FROM results').fetchall()
+    finally:
+        db.close()
+    print('{0:d} results'.format(len(rows)))
+    versions = {}
+    for (fields,) in rows:
+        code = json.loads(fields or '{}').get('code', 'unknown')
+        versions[code] = versions.get(code, 0) + 1
+    for code, n in sorted(versions.items()):
+        print('\t{0!s}: {1:d}'.format(code, n))
+
+if __name__ == '__main__':
+    main()
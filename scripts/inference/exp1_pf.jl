@@ -31,6 +31,11 @@ function parse_commandline()
         arg_type = Float64
         default = 0.1
 
+        "--out_dir"
+        help = "Output directory (named by the parameters if empty)"
+        arg_type = String
+        default = ""
+
         "idx"
         help = "idx of trial"
         arg_type = Int
@@ -47,7 +52,10 @@ function main()
     idx = args["idx"]
     particles = args["particles"]
     obs_noise = args["obs_noise"]
-    out_dir = "/traces/$(dataset_name)_p_$(particles)_n_$(obs_noise)"
+    out_dir = args["out_dir"]
+    if isempty(out_dir)
+        out_dir = "/traces/$(dataset_name)_p_$(particles)_n_$(obs_noise)"
+    end
     df = evaluation(obs_noise, particles,
                     args["dataset"], idx,
                     chains = args["chains"])
@@ -55,7 +63,10 @@ function main()
     isdir(out_dir) || mkdir(out_dir)
     out = "$out_dir/$(idx).csv"
     args["restart"] && isfile(out) && rm(out)
-    CSV.write(out, df)
+    # written aside and moved so that partial results are never read
+    tmp = "$(out).tmp"
+    CSV.write(tmp, df)
+    mv(tmp, out, force = true)
     return nothing
 end
 
@@ -0,0 +1,27 @@
+""" Puts the python modules shared across scripts on `sys.path`.
+
+Scripts in `scripts/<dir>/` import it with::
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..'))
+    import repo_paths
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHARED = [
+    # `trace_store` (also imported by `render.py` inside blender)
+    os.path.join(ROOT, 'src', 'utils', 'blend'),
+    # `scene_catalog`, `exp1_stimuli_from_scenes`
+    os.path.join(ROOT, 'scripts', 'stimuli'),
+    # `executor`, `result_cache`
+    os.path.join(ROOT, 'scripts', 'batch'),
+    # `collisions`, `ramp_physics`
+    os.path.join(ROOT, 'scripts', 'validation'),
+]
+
+for path in SHARED:
+    if not path in sys.path:
+        sys.path.append(path)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+""" Benchmarks render quality presets on a reference trial.
+
+Renders the same frames at each preset in `render.py` and reports
+the seconds per frame along with the image difference relative
+to the `final` preset. Each run renders into fresh directories so that
+no frame is skipped as already rendered (see `render.py`'s manifest).
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+import trace_store
+
+blender_exec = '/blender/blender'
+base_path = '/project/galileo_ramp/blend/'
+render_path = base_path + 'render.py'
+blend_path = base_path + 'new_scene.blend'
+
+tiers = ['draft', 'preview', 'final']
+frame_time = re.compile(r'Rendering frame \d+ at .+ took ([0-9.e-]+)s')
+
+def binary_trace(trace, out):
+    """ Path to a binary copy (see `trace_store`) of a json trace """
+    if trace_store.is_trace_store(trace):
+        return trace
+    os.makedirs(out, exist_ok = True)
+    path = os.path.join(out, 'trace' + trace_store.EXT)
+    with open(trace, 'r') as f:
+        trace_store.write(path, json.load(f))
+    return path
+
+def render_tier(scene, trace, out, tier, frames, res):
+    """ Renders `frames` at the given quality preset.
+
+    Arguments:
+        scene (str): Path to scene json
+        trace (str): Path to a binary trace
+        out   (str): Directory to save renderings
+        tier  (str): Quality preset
+    Returns
+        A list of render times (seconds) per frame
+    """
+    cmd = [blender_exec, '-noaudio', '--background', blend_path,
+           '--python', render_path, '--',
+           '--scene', scene,
+           '--trace', trace,
+           '--out', out,
+           '--quality', tier,
+           '--resolution', str(res[0]), str(res[1]),
+           '--frames', *map(str, frames)]
+    os.makedirs(out, exist_ok = True)
+    p = subprocess.run(cmd, stdout = subprocess.PIPE,
+                       universal_newlines = True, check = True)
+    times = [float(t) for t in frame_time.findall(p.stdout)]
+    if len(times) != len(frames):
+        msg = 'Rendered {0:d} of {1:d} frames at {2!s}'
+        raise RuntimeError(msg.format(len(times), len(frames), tier))
+    return times
+
+def image_difference(a, b):
+    """ Mean absolute error and PSNR between two images in [0, 1] """
+    a = plt.imread(a)[..., :3]
+    b = plt.imread(b)[..., :3]
+    mse = np.mean(np.square(a - b))
+    psnr = np.inf if mse == 0 else 10 * np.log10(1.0 / mse)
+    return np.mean(np.abs(a - b)), psnr
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description = 'Benchmarks render quality presets',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('scene', type = str,
+                        help = 'Path to reference scene json')
+    parser.add_argument('trace', type = str,
+                        help = 'Path to reference trace (json or binary)')
+    parser.add_argument('--out', type = str,
+                        default = '/renders/benchmark',
+                        help = 'Directory to save renderings')
+    parser.add_argument('--frames', type = int, nargs = '+',
+                        default = [0, 60, 120, 180],
+                        help = 'Frames to render')
+    parser.add_argument('--resolution', type = int, nargs = 2,
+                        default = (600, 400),
+                        help = 'Resolution for images')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok = True)
+    # converted once so that every tier reads the same binary trace
+    trace = binary_trace(args.trace, args.out)
+
+    # `final` is rendered first as the reference
+    times = {}
+    outs = {}
+    for tier in reversed(tiers):
+        outs[tier] = tempfile.mkdtemp(prefix = tier + '_', dir = args.out)
+        times[tier] = render_tier(args.scene, trace, outs[tier], tier,
+                                  args.frames, args.resolution)
+
+    rows = []
+    ref = os.path.join(outs['final'], 'render')
+    for tier in tiers:
+        path = os.path.join(outs[tier], 'render')
+        diffs = [image_difference(os.path.join(path, '{0:d}.png'.format(i)),
+                                  os.path.join(ref, '{0:d}.png'.format(i)))
+                 for i in range(len(args.frames))]
+        mae, psnr = np.mean(diffs, axis = 0)
+        rows.append({'tier' : tier,
+                     'out' : outs[tier],
+                     'sec_per_frame' : np.mean(times[tier]),
+                     'mae' : mae,
+                     'psnr' : psnr})
+
+    df = pd.DataFrame.from_records(rows)
+    print(df.to_string(index = False))
+    df.to_csv(os.path.join(args.out, 'benchmark.csv'), index = False)
+
+if __name__ == '__main__':
+    main()
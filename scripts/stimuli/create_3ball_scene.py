@@ -10,6 +10,8 @@ from itertools import chain
 from rbw import shapes, worlds, simulation
 from rbw.utils.encoders import NpEncoder
 
+import scene_catalog
+
 surface_phys = {'density' : 0.0,
                 'friction': 0.3}
 obj_dims = np.array([3.0, 3.0, 1.5]) / 10.0
@@ -55,13 +57,17 @@ def main():
     os.path.isdir(out_path) or os.mkdir(out_path)
 
     # makes 20 scenes ...
+    scenes = []
     for i in range(20):
         scene = ...
         p = os.path.join(out_path, '{0:d}.json'.format(i))
         data = {'scene' : scene.serialize()}
+        scenes.append(data['scene'])
         with open(p, 'w') as f:
             json.dump(data, f, indent = 2, cls = NpEncoder)
         pass
+    scene_catalog.write(os.path.join(out_path, scene_catalog.CATALOG),
+                        scenes, encoder = NpEncoder)
 
 
     # write out metadata
@@ -6,10 +6,13 @@ import argparse
 import numpy as np
 from copy import deepcopy
 from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 
 from rbw import shapes, worlds, simulation
 from rbw.utils.encoders import NpEncoder
 
+import scene_catalog
+
 surface_phys = {'density' : 0.0,
                 'friction': 0.3}
 obj_dims = np.array([3.0, 3.0, 1.5]) / 10.0
@@ -31,16 +34,16 @@ def low_densities(n):
 def high_densities(n):
     return np.exp(np.linspace(5.0, 5.5, num = n))
 
-def sample_dimensions(base):
+def sample_dimensions(base, rng):
     bound = np.log(1.6)
-    samples = np.exp(np.random.uniform(-1*bound,bound, size = 3))
+    samples = np.exp(rng.uniform(-1*bound,bound, size = 3))
     return base * samples
 
 def interpolate_positions(n):
     return np.linspace(1.5, 1.8, num = n)
 
-def make_pair(scene, material, shp, density, pos):
-    dims = sample_dimensions(obj_dims)
+def make_pair(scene, material, shp, density, pos, rng):
+    dims = sample_dimensions(obj_dims, rng)
     congruent = canonical_object(material, shp, dims)
     incongruent = shapes.shape.change_prop(congruent, 'density', density)
     con = deepcopy(scene)
@@ -49,13 +52,61 @@ def make_pair(scene, material, shp, density, pos):
     incon.add_object('A', incongruent, pos)
     return [con, incon]
 
-def make_control(scene, material, shape, pos):
-    dims = sample_dimensions(obj_dims)
+def make_control(scene, material, shape, pos, rng):
+    dims = sample_dimensions(obj_dims, rng)
     obj = canonical_object(material, shape, dims)
     s = deepcopy(scene)
     s.add_object('A', obj, pos)
     return s
 
+def scene_specs():
+    """ Enumerates the design in trial order.
+
+    Each spec yields the 2 scenes of a pair or a single control.
+    """
+    specs = []
+    # materials have the same proportions of heavy/light perturbations
+    densities = np.hstack((low_densities(5),
+                           high_densities(5)))
+    positions = interpolate_positions(5)
+    positions = np.repeat(positions, 2)
+
+    # generate the 60 pairs of ramp objects
+    for m in ['Iron', 'Brick', 'Wood']:
+        for shp in [shapes.Block, shapes.Puck]:
+            for dp in zip(densities, positions):
+                specs.append(('pair', m, shp, *dp))
+
+    # generate the 90 control trials (not paired/matched)
+    positions = interpolate_positions(5)
+    positions = np.repeat(positions, 3)
+    for m in ['Iron', 'Brick', 'Wood']:
+        for shp in [shapes.Block, shapes.Puck]:
+        # 15 vs 30 since there are 2 (block+puck) per loop
+            for p in positions:
+                specs.append(('control', m, shp, p))
+    return specs
+
+def build_scenes(base, spec, seed, key):
+    """ Builds and serializes the scenes for one spec.
+
+    The random stream depends only on the master seed and `key`,
+    so the result does not depend on which worker builds it.
+
+    Returns
+        A list of json strings
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed,
+                                                       spawn_key = (key,)))
+    kind, *params = spec
+    if kind == 'pair':
+        scenes = make_pair(base, *params, rng)
+    else:
+        scenes = [make_control(base, *params, rng)]
+    return [json.dumps({'scene' : s.serialize()}, indent = 2,
+                       cls = NpEncoder)
+            for s in scenes]
+
 def main():
     parser = argparse.ArgumentParser(
         description = 'Generates an HDF5 for the Exp 1 dataset',
@@ -67,8 +118,23 @@ def main():
                         help = 'XY dimensions of ramp.')
     parser.add_argument('--ramp_angle', type = float, default = 35,
                         help = 'ramp angle in degrees')
+    parser.add_argument('--seed', type = int,
+                        help = 'Master seed. Random if not given.')
+    parser.add_argument('--repeats', type = int, default = 1,
+                        help = 'Number of copies of the design, each ' +\
+                        'with its own random streams')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'Number of processes building scenes')
+    parser.add_argument('--out', type = str, default = '/scenes/exp1/',
+                        help = 'Directory to save scenes')
+    parser.add_argument('--no_json', action = 'store_true',
+                        help = 'Only write the scene catalog')
     args = parser.parse_args()
 
+    seed = args.seed
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    print('Using seed {0:d}'.format(seed))
 
     # table and table object (`B`) is held constant
     base = worlds.RampWorld(args.table, args.ramp,
@@ -78,53 +144,44 @@ def main():
     table_obj = canonical_object("Brick", shapes.Block, obj_dims)
     base.add_object("B", table_obj, 0.35)
 
-    # materials have the same proportions of heavy/light perturbations
-    densities = np.hstack((low_densities(5),
-                           high_densities(5)))
-    positions = interpolate_positions(5)
-    positions = np.repeat(positions, 2)
+    # the pairs come first (2 scenes each) followed by the controls,
+    # for any number of repeats
+    specs = scene_specs()
+    pairs = [s for s in specs if s[0] == 'pair']
+    controls = [s for s in specs if s[0] == 'control']
+    specs = pairs * args.repeats + controls * args.repeats
+    # ie. `--n_matched` of `exp1_stimuli_from_scenes.py`
+    print('{0:d} matched scenes'.format(2 * len(pairs) * args.repeats))
+    keys = range(len(specs))
 
-    # generate the 60 pairs of ramp objects
-    pairs = []
-    for m in ['Iron', 'Brick', 'Wood']:
-        for shp in [shapes.Block, shapes.Puck]:
-            for dp in zip(densities, positions):
-                pairs.append(make_pair(base, m, shp, *dp))
-
-    # generate the 90 control trials (not paired/matched)
-    controls = []
-    positions = interpolate_positions(5)
-    positions = np.repeat(positions, 3)
-    for m in ['Iron', 'Brick', 'Wood']:
-        for shp in [shapes.Block, shapes.Puck]:
-        # 15 vs 30 since there are 2 (block+puck) per loop
-            for p in positions:
-                controls.append(make_control(base, m, shp, p))
-
-    # for each scene (pair or control) randomly pick an initial
-    # positions for object `A`
-    scenes = list(chain.from_iterable(pairs))
-    print(len(scenes))
-    scenes += controls
-    print(len(scenes))
     # save trials to json
-    out_path = '/scenes/exp1/'
+    out_path = args.out
     if not os.path.isdir(out_path):
         os.mkdir(out_path)
-    for i,s in enumerate(scenes):
-        p = os.path.join(out_path, '{0:d}.json'.format(i))
-        # trace  = physics.run_full_trace(s.serialize(),
-        #                               ['A', 'B'],
-        #                               fps = 60,
-        #                               time_scale = 1.0,
-        #                               debug = True)
-        data = {'scene' : s.serialize()}
-        with open(p, 'w') as f:
-            json.dump(data, f, indent = 2, cls = NpEncoder)
+    i = 0
+    catalog = []
+    with ProcessPoolExecutor(max_workers = args.workers) as pool:
+        results = pool.map(build_scenes,
+                           [base] * len(specs), specs,
+                           [seed] * len(specs), keys,
+                           chunksize = 8)
+        # `map` preserves order so scenes are written by a single writer
+        for scenes in results:
+            for data in scenes:
+                catalog.append(json.loads(data)['scene'])
+                i += 1
+                if args.no_json:
+                    continue
+                p = os.path.join(out_path, '{0:d}.json'.format(i - 1))
+                with open(p, 'w') as f:
+                    f.write(data)
+    print(i)
+    scene_catalog.write(os.path.join(out_path, scene_catalog.CATALOG),
+                        catalog)
 
     # write out metadata
-    with open(out_path + 'info', 'w') as f:
-        json.dump({'trials' : len(scenes)}, f)
+    with open(os.path.join(out_path, 'info'), 'w') as f:
+        json.dump({'trials' : i, 'seed' : seed}, f)
 
 if __name__ == '__main__':
     main()
@@ -14,6 +14,8 @@ from physics.world.scene.ramp import RampScene
 from physics.world.simulation import physics
 from physics.utils import encoders
 
+import scene_catalog
+
 surface_phys = {'density' : 0.0,
                 'friction': 0.3}
 obj_dims = np.array([3.0, 3.0, 1.5]) / 10.0
@@ -115,6 +117,9 @@ def main():
         data = {'scene' : s.serialize()}
         with open(p, 'w') as f:
             json.dump(data, f, indent = 2, cls = encoders.NpEncoder)
+    scene_catalog.write(os.path.join(out_path, scene_catalog.CATALOG),
+                        [s.serialize() for s in scenes],
+                        encoder = encoders.NpEncoder)
 
     # write out metadata
     with open(out_path + 'info', 'w') as f:
@@ -5,14 +5,21 @@
 Uses a timing file containing time points of interest
 for each scene to be generated.
 
+Trials are read from a scene catalog (`scenes.h5`) and a timing file,
+which only touches scene metadata. Both are exported from the full
+`Exp1Dataset` (see `export_metadata`) the first time they are missing.
 """
 import os
+import re
 import json
 import argparse
 import numpy as np
 import pandas as pd
 
-from galileo_ramp.exp1_dataset import Exp1Dataset
+import scene_catalog
+from scene_catalog import SceneCatalog
+
+TIMINGS = 'timings.json'
 
 data_to_copy = ['appearance', 'shape', 'volume']
 def extract_scene_data(scene):
@@ -25,42 +32,100 @@ def extract_scene_data(scene):
     data['init_pos_table'] = scene['initial_pos']['B']
     return data
 
-def main():
+class TrialMetadata:
 
-    parser = argparse.ArgumentParser(
-        description = 'Generates stimuli based off inference timings',
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter
-    )
-    parser.add_argument('--dataset', type = str,
-                        default = '/databases/exp1.hdf5',
-                        help = 'Path to dataset')
-    parser.add_argument('--n_cond', type = int,
-                        default = 8)
-    args = parser.parse_args()
+    """
+    Lazy access to the scene and time points of each trial.
 
-    dataset = Exp1Dataset(args.dataset)
+    Unlike `Exp1Dataset`, physics traces are never read.
 
-    out = '/movies/trials'
-    if not os.path.isdir(out):
-        os.mkdir(out)
+    :param catalog: Path to a scene catalog
+    :param timings: Path to a json list of time points for each trial
+    """
 
-    trial_data = []
-    idx = 0
+    def __init__(self, catalog, timings):
+        self.catalog = SceneCatalog(catalog)
+        with open(timings, 'r') as f:
+            self.timings = json.load(f)
+        if len(self.timings) != len(self.catalog):
+            msg = 'Timings for {0:d} trials but {1:d} scenes'
+            raise ValueError(msg.format(len(self.timings), len(self.catalog)))
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, idx):
+        """ Returns `(scene, time_points)` """
+        return self.catalog[idx], self.timings[idx]
+
+class DatasetMetadata:
+
+    """
+    `TrialMetadata` over an `Exp1Dataset` (loads full traces).
+    """
+
+    def __init__(self, path):
+        from galileo_ramp.exp1_dataset import Exp1Dataset
+        self.dataset = Exp1Dataset(path)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        (scene, _, time_points) = self.dataset[idx]
+        return scene, time_points
+
+def export_metadata(dataset, catalog, timings):
+    """ Writes the scenes and time points of an `Exp1Dataset`.
+
+    Reads every trace once so that later runs can use `TrialMetadata`.
+
+    Arguments:
+        dataset (str): Path to the dataset
+        catalog (str): Path of the scene catalog to write
+        timings (str): Path of the time point json to write
+    """
+    from rbw.utils.encoders import NpEncoder
+    trials = DatasetMetadata(dataset)
+    scenes = []
+    time_points = []
+    for t in range(len(trials)):
+        scene, tps = trials[t]
+        scenes.append(scene)
+        time_points.append(np.asarray(tps).tolist())
+    scene_catalog.write(catalog, scenes, encoder = NpEncoder)
+    with open(timings, 'w') as f:
+        json.dump(time_points, f)
+
+def trial_path(trial, tg):
+    return '{0:d}_t-{1:d}.mp4'.format(trial, tg)
+
+def timing_group(path):
+    """ Parses the timing group of a stimulus path """
+    return int(re.search(r'_t-(\d+)\.mp4$', path).group(1))
 
-    for t in range(len(dataset)):
-        (scene, _, time_points) = dataset[t]
-        out_path = os.path.join(out, str(t))
-        # stims_from_scene(i, out_path, *cond, args.pad)
+def stimulus_path(entry):
+    """ Path of a list entry, either a path or `(path, [colors])` """
+    return entry if isinstance(entry, str) else entry[0]
 
-        if t < 120:
+def trial_data(trials, n_matched = 120):
+    """ Returns a row per (trial, time point) as `pd.DataFrame`.
+
+    The first `n_matched` trials are congruent / incongruent pairs;
+    the rest are controls.
+    """
+    rows = []
+    idx = 0
+    for t in range(len(trials)):
+        (scene, time_points) = trials[t]
+        if t < n_matched:
             tidx = int(np.floor(t / 2))
             con = (t % 2) == 0
             tpe = "matched"
         else:
-            tidx = t - 60
+            tidx = t - n_matched // 2
             con = True
             tpe = "control"
-           
 
         scene_data = extract_scene_data(scene)
         scene_data.update({
@@ -70,38 +135,136 @@ def main():
             })
 
         for c,time in enumerate(time_points):
-            path = '{0:d}_t-{1:d}.mp4'.format(t, c)
             trial_datum = {
                 'idx' : idx,
-                'path' : path,
+                'path' : trial_path(t, c),
                 'cond' : c,
                 'time' : time
             }
             trial_datum.update(scene_data)
-            trial_data.append(trial_datum)
+            rows.append(trial_datum)
             idx += 1
+    return pd.DataFrame.from_records(rows)
 
+def condition_lists(n_trials, n_times, n_lists, n_cond = 8, n_matched = 120,
+                    seed = None):
+    """ Counterbalanced stimulus lists.
 
-    df = pd.DataFrame.from_records(trial_data)
-    df.to_csv(out + '/trial_data.csv', index = False)
+    Each list shows every matched pair once (in one of its two versions)
+    and every control once, cycling through the `2 * n_times` (version,
+    timing group) cells. Lists are fully counterbalanced when `n_cond` is
+    a multiple of `2 * n_times`.
 
-    condition_list = []
-    i = 0
-    for cond in range(args.n_cond):
+    Arguments:
+        n_trials (int): Number of trials
+        n_times (int): Time points per trial
+        n_lists (int): Number of lists (ie. participants); list `i`
+            follows condition `i % n_cond`
+        n_cond (int): Number of counterbalancing conditions
+        seed (int, optional): Shuffles the order within each list
+    Returns
+        A list of lists of stimulus paths
+    """
+    cells = 2 * n_times
+    items = n_matched // 2 + n_trials - n_matched
+    rng = None if seed is None else np.random.default_rng(seed)
+    lists = []
+    for l in range(n_lists):
+        cond = l % n_cond
         clist = []
-        for t in range(150):
-            idx = int((i + cond) % args.n_cond)
-            if t < 60:
-                if idx < 4:
-                    path = '{0:d}_t-{1:d}.mp4'.format(t*2, idx % 4)
-                else:
-                    path = '{0:d}_t-{1:d}.mp4'.format(t*2 + 1, idx % 4)
-
+        for t in range(items):
+            idx = (t - cond) % cells
+            if t < n_matched // 2:
+                version = idx // n_times
+                path = trial_path(t * 2 + version, idx % n_times)
             else:
-                path = '{0:d}_t-{1:d}.mp4'.format(60 + t, idx % 4)
+                path = trial_path(n_matched // 2 + t, idx % n_times)
             clist.append(path)
-            i += 1
-        condition_list.append(clist)
+        if not rng is None:
+            clist = [clist[i] for i in rng.permutation(len(clist))]
+        lists.append(clist)
+    return lists
+
+def balance(lists, n_times):
+    """ Counts of each timing group per list.
+
+    Returns
+        A `pd.DataFrame` with a row per list and a column per group
+    """
+    counts = np.zeros((len(lists), n_times), dtype = int)
+    for i, clist in enumerate(lists):
+        tgs = [timing_group(stimulus_path(p)) for p in clist]
+        counts[i] = np.bincount(tgs, minlength = n_times)[:n_times]
+    df = pd.DataFrame(counts, columns = ['t-{0:d}'.format(c)
+                                         for c in range(n_times)])
+    df.index.name = 'list'
+    return df
+
+def report(lists, n_times):
+    """ Prints the balance of each list and of stimuli across lists """
+    df = balance(lists, n_times)
+    print(df.to_string())
+    spread = (df.max(axis = 1) - df.min(axis = 1)).max()
+    print('Largest within-list imbalance: {0:d}'.format(spread))
+    shown = pd.Series([stimulus_path(p) for clist in lists
+                       for p in clist]).value_counts()
+    msg = 'Stimuli shown {0:d}-{1:d} times ({2:d} distinct)'
+    print(msg.format(shown.min(), shown.max(), len(shown)))
+    return df
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description = 'Generates stimuli based off inference timings',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--dataset', type = str,
+                        default = '/databases/exp1.hdf5',
+                        help = 'Path to dataset')
+    parser.add_argument('--catalog', type = str,
+                        help = 'Scene catalog to read. Defaults to ' +\
+                        '`<out>/scenes.h5`, exported from the dataset ' +\
+                        'if missing.')
+    parser.add_argument('--timings', type = str,
+                        help = 'Json of time points per trial. Defaults ' +\
+                        'to `<out>/timings.json` (see `--catalog`)')
+    parser.add_argument('--n_cond', type = int,
+                        default = 8)
+    parser.add_argument('--participants', type = int,
+                        help = 'Write a list per participant instead ' +\
+                        'of per condition')
+    parser.add_argument('--n_matched', type = int, default = 120,
+                        help = 'Number of trials in matched pairs')
+    parser.add_argument('--seed', type = int,
+                        help = 'Shuffle the order within each list')
+    parser.add_argument('--out', type = str, default = '/movies/trials',
+                        help = 'Output directory')
+    args = parser.parse_args()
+
+    out = args.out
+    if not os.path.isdir(out):
+        os.mkdir(out)
+
+    if args.catalog is None and args.timings is None:
+        catalog = os.path.join(out, scene_catalog.CATALOG)
+        timings = os.path.join(out, TIMINGS)
+        if not (os.path.isfile(catalog) and os.path.isfile(timings)):
+            print('Exporting scene metadata of {0!s}'.format(args.dataset))
+            export_metadata(args.dataset, catalog, timings)
+    elif args.catalog is None or args.timings is None:
+        parser.error('--catalog and --timings must be given together')
+    else:
+        catalog, timings = args.catalog, args.timings
+    trials = TrialMetadata(catalog, timings)
+
+    df = trial_data(trials, args.n_matched)
+    df.to_csv(out + '/trial_data.csv', index = False)
+
+    n_times = int(df['cond'].max()) + 1
+    n_lists = args.n_cond if args.participants is None else args.participants
+    condition_list = condition_lists(len(trials), n_times, n_lists,
+                                     args.n_cond, args.n_matched, args.seed)
+    report(condition_list, n_times)
 
     out_path = os.path.join(out, 'condlist.json')
     with open(out_path, 'w') as f:
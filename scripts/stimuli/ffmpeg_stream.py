@@ -0,0 +1,83 @@
+""" Single pass ffmpeg commands for cutting stimuli from renderings.
+
+Rather than encoding a continuous movie for each time point and then
+re-encoding it with a mask, the rendered frames are decoded once and
+split inside one ffmpeg filter graph into every truncation.
+"""
+import subprocess
+
+# mp4 timescale of every clip so that time bases agree across clips
+TIMESCALE = 15360
+
+def x264_args(pix_fmt = 'yuv420p'):
+    """ Encoder settings shared by stimuli and mask clips.
+
+    Clips encoded with the same settings, resolution, and frame rate
+    can be joined with a stream copy (see `mask_cache.concat`).
+    """
+    return ['-c:v', 'libx264', '-pix_fmt', pix_fmt, '-profile:v', 'high',
+            '-video_track_timescale', str(TIMESCALE)]
+
+def mask_source(kind, dur, fps, res):
+    """ Filter graph source for a mask clip.
+
+    Arguments:
+        kind (str): Either 'black' or 'noise'
+        dur (float): Duration in seconds
+        fps (int): Frame rate
+        res (tuple): Width and height
+    """
+    size = '{0:d}x{1:d}'.format(*res)
+    if kind == 'black':
+        src = 'color=c=black:s={0!s}:r={1:d}:d={2:f}'
+    elif kind == 'noise':
+        src = 'nullsrc=s={0!s}:r={1:d}:d={2:f},geq=random(1)*255:128:128'
+    else:
+        raise ValueError('Unknown mask {0!s}'.format(kind))
+    return src.format(size, fps, dur)
+
+def stream_cmd(src, outs, timings, fps = 60, mask = None, dur = 0.250,
+               res = (600, 400)):
+    """ Returns an ffmpeg command that cuts all timings in one pass.
+
+    Arguments:
+        src (str): Image sequence (ie. `render/%d.png`)
+        outs (list): Output path for each timing
+        timings (list): Number of frames to keep for each output
+        mask (str, optional): Mask prepended to each output
+    Returns
+        A list of arguments for `subprocess`
+    """
+    n = len(outs)
+    graph = ['[0:v]setsar=1,split={0:d}{1!s}'.format(
+        n, ''.join('[v{0:d}]'.format(i) for i in range(n)))]
+    if not mask is None:
+        graph.append('{0!s},setsar=1,split={1:d}{2!s}'.format(
+            mask_source(mask, dur, fps, res), n,
+            ''.join('[m{0:d}]'.format(i) for i in range(n))))
+    for i, t in enumerate(timings):
+        cut = '[v{0:d}]trim=end_frame={1:d},setpts=PTS-STARTPTS'.format(i, t)
+        if mask is None:
+            graph.append(cut + '[o{0:d}]'.format(i))
+        else:
+            graph.append(cut + '[c{0:d}]'.format(i))
+            graph.append('[m{0:d}][c{0:d}]concat=n=2:v=1:a=0[o{0:d}]'.format(i))
+
+    cmd = ['ffmpeg', '-y', '-framerate', str(fps), '-i', src,
+           '-filter_complex', ';'.join(graph)]
+    for i, out in enumerate(outs):
+        cmd += ['-map', '[o{0:d}]'.format(i)] + x264_args() + [out]
+    return cmd
+
+def run(cmd, tail = 20):
+    """ Runs an ffmpeg command, raising on failure.
+
+    The error includes the last `tail` lines of ffmpeg's stderr.
+    """
+    p = subprocess.run(cmd, stdout = subprocess.DEVNULL,
+                       stderr = subprocess.PIPE, universal_newlines = True)
+    if p.returncode != 0:
+        lines = p.stderr.strip().splitlines()[-tail:]
+        msg = '{0!s} exited with status {1:d}:\n{2!s}'
+        raise RuntimeError(msg.format(cmd[0], p.returncode,
+                                      '\n'.join(lines)))
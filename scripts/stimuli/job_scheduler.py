@@ -0,0 +1,110 @@
+""" Runs a graph of independent jobs (ie. ffmpeg calls) in parallel.
+
+Jobs are dispatched to a process pool as soon as their dependencies
+complete. Failed jobs are retried and a progress line is printed
+as each job finishes.
+"""
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+class Job:
+
+    """
+    A unit of work in the schedule.
+
+    :param name: Unique name of the job
+    :param func: A picklable callable
+    :param args: Arguments to `func`
+    :param deps: Names of jobs that must complete first
+    :param desc: Description printed for dry runs
+    """
+
+    def __init__(self, name, func, args = (), deps = (), desc = None):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.deps = list(deps)
+        self.desc = name if desc is None else desc
+
+def _timed(func, args):
+    t_0 = time.time()
+    func(*args)
+    return time.time() - t_0
+
+def print_graph(jobs):
+    """ Prints each job, its description, and its dependencies """
+    for job in jobs:
+        print(job.name)
+        print('\t' + job.desc)
+        if job.deps:
+            print('\tafter: ' + ', '.join(job.deps))
+    print('{0:d} jobs'.format(len(jobs)))
+    sys.stdout.flush()
+
+def run_jobs(jobs, workers = 1, retries = 0, dry_run = False):
+    """ Runs jobs with at most `workers` at a time.
+
+    Jobs whose dependencies failed are skipped.
+
+    Returns
+        A dictionary with the names of `done`, `failed`, and `skipped` jobs
+    """
+    if dry_run:
+        print_graph(jobs)
+        return {'done' : [], 'failed' : [], 'skipped' : []}
+
+    pending = {j.name : j for j in jobs}
+    attempts = dict.fromkeys(pending, 0)
+    done, failed, skipped = [], [], []
+    busy = 0.
+    running = {}
+    t_0 = time.time()
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        while pending or running:
+            # dispatch ready jobs
+            for name, job in list(pending.items()):
+                if any(d in failed or d in skipped for d in job.deps):
+                    skipped.append(name)
+                    del pending[name]
+                elif all(d in done for d in job.deps):
+                    attempts[name] += 1
+                    f = pool.submit(_timed, job.func, job.args)
+                    running[f] = job
+                    del pending[name]
+            if not running:
+                # remaining jobs depend on unknown names
+                skipped.extend(pending)
+                pending.clear()
+                continue
+
+            finished, _ = wait(running, return_when = FIRST_COMPLETED)
+            for f in finished:
+                job = running.pop(f)
+                try:
+                    dur = f.result()
+                except Exception as e:
+                    if attempts[job.name] <= retries:
+                        print('Retrying {0!s} after {1!s}'.format(job.name, e))
+                        pending[job.name] = job
+                    else:
+                        print('Failed {0!s}: {1!s}'.format(job.name, e))
+                        failed.append(job.name)
+                    continue
+                busy += dur
+                done.append(job.name)
+                elapsed = time.time() - t_0
+                msg = '[{0:d}/{1:d}] {2!s} took {3:.1f}s ' + \
+                      '({4:.2f} jobs/min)'
+                print(msg.format(len(done), len(jobs), job.name, dur,
+                                 60 * len(done) / elapsed))
+                sys.stdout.flush()
+
+    elapsed = time.time() - t_0
+    msg = 'Completed {0:d} jobs ({1:d} failed, {2:d} skipped) in ' + \
+          '{3:.1f}s; {4:.2f} jobs/min; {5:.1f}x parallel speedup'
+    print(msg.format(len(done), len(failed), len(skipped), elapsed,
+                     60 * len(done) / max(elapsed, 1e-9),
+                     busy / max(elapsed, 1e-9)))
+    sys.stdout.flush()
+    return {'done' : done, 'failed' : failed, 'skipped' : skipped}
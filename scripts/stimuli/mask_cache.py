@@ -0,0 +1,87 @@
+""" Reusable mask clips for stimuli.
+
+Every stimulus shares the same few mask clips so each is encoded
+once and then joined to a movie with a stream copy when possible.
+"""
+import os
+import json
+import tempfile
+import subprocess
+
+from ffmpeg_stream import mask_source, run, x264_args
+
+# stream parameters that must agree for a stream copy concat
+copy_keys = ['codec_name', 'profile', 'level', 'width', 'height', 'pix_fmt',
+             'sample_aspect_ratio', 'r_frame_rate', 'time_base']
+
+class MaskCache:
+
+    """
+    A directory of mask clips keyed on
+    `(kind, duration, fps, resolution, pix_fmt)`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok = True)
+
+    def path(self, kind, dur, fps, res, pix_fmt = 'yuv420p'):
+        name = '{0!s}_{1:d}ms_{2:d}fps_{3:d}x{4:d}_{5!s}.mp4'
+        name = name.format(kind, int(round(dur * 1000)), fps,
+                           res[0], res[1], pix_fmt)
+        return os.path.join(self.root, name)
+
+    def get(self, kind, dur, fps, res, pix_fmt = 'yuv420p'):
+        """ Returns the path to a mask clip, encoding it if needed. """
+        out = self.path(kind, dur, fps, res, pix_fmt)
+        if os.path.isfile(out):
+            return out
+        # encode to a temporary file in case of concurrent builds
+        fd, tmp = tempfile.mkstemp(suffix = '.mp4', dir = self.root)
+        os.close(fd)
+        # encoded like the clips of `ffmpeg_stream`
+        cmd = ['ffmpeg', '-y', '-f', 'lavfi',
+               '-i', mask_source(kind, dur, fps, res) + ',setsar=1']
+        cmd += x264_args(pix_fmt) + [tmp]
+        run(cmd)
+        os.replace(tmp, out)
+        return out
+
+def probe(path):
+    """ Returns the parameters of the first video stream in `path` """
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'stream=' + ','.join(copy_keys),
+           '-of', 'json', path]
+    p = subprocess.run(cmd, check = True, stdout = subprocess.PIPE,
+                       universal_newlines = True)
+    return json.loads(p.stdout)['streams'][0]
+
+def concat(paths, out):
+    """ Joins movies, with a stream copy if their video streams match.
+
+    Falls back to re-encoding through the concat filter otherwise.
+    """
+    streams = [probe(p) for p in paths]
+    if all(s == streams[0] for s in streams):
+        with tempfile.NamedTemporaryFile('w', suffix = '.txt',
+                                         delete = False) as f:
+            for p in paths:
+                f.write("file '{0!s}'\n".format(os.path.abspath(p)))
+        cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0',
+               '-i', f.name, '-c', 'copy', out]
+        try:
+            run(cmd)
+        finally:
+            os.remove(f.name)
+        return
+
+    cmd = ['ffmpeg', '-y']
+    for p in paths:
+        cmd += ['-i', p]
+    # the concat filter also needs matching sample aspect ratios
+    graph = ''.join('[{0:d}:v]setsar=1[s{0:d}];'.format(i)
+                    for i in range(len(paths)))
+    graph += ''.join('[s{0:d}]'.format(i) for i in range(len(paths)))
+    graph += 'concat=n={0:d}:v=1:a=0[v]'.format(len(paths))
+    cmd += ['-filter_complex', graph, '-map', '[v]'] + x264_args() + [out]
+    run(cmd)
@@ -11,6 +11,8 @@ import numpy as np
 
 from physics.utils import ffmpeg
 
+import ffmpeg_stream
+
 def main():
 
     parser = argparse.ArgumentParser(
@@ -24,6 +26,8 @@ def main():
                         help = 'Time points to cut video')
     parser.add_argument('--mask', action = 'store_true',
                         help = 'Add mask to non-terminal conditions')
+    parser.add_argument('--sequential', action = 'store_true',
+                        help = 'Encode each timing in a separate pass')
     args = parser.parse_args()
 
     # Set mask
@@ -43,11 +47,20 @@ def main():
     # Create motion component
     src_path = '{0!s}/render/%d.png'.format(args.renders)
 
+    out_paths = []
     for t in args.timings:
         out_path = os.path.basename(args.renders)
         out_path = '{0!s}_t-{1:d}.mp4'.format(out_path, t)
-        out_path = os.path.join(movie_dir, out_path)
+        out_paths.append(os.path.join(movie_dir, out_path))
+
+    if not args.sequential:
+        # decode the frames once for all timings
+        cmd = ffmpeg_stream.stream_cmd(src_path, out_paths, args.timings,
+                                       fps = 60)
+        ffmpeg_stream.run(cmd)
+        return
 
+    for t, out_path in zip(args.timings, out_paths):
         # Create raw video
         ffmpeg.continous_movie(src_path, out_path, fps = 60,
                                vframes = t)
@@ -7,6 +7,7 @@ for each scene to be generated.
 
 """
 import os
+import sys
 import json
 import shlex
 import argparse
@@ -16,26 +17,28 @@ import numpy as np
 from physics.utils import ffmpeg
 from galileo_ramp.exp1_dataset import Exp1Dataset
 
-def noise_mask(src, out, dur, fps):
-    """ Creates white noise mask """
-    cmd = 'ffmpeg -y -f lavfi -r {0:d} -i nullsrc=s=600x400 -filter_complex "geq=random(1)*255:128:128" -t {1:f} -pix_fmt yuv420p {2!s}'
-    cmd = cmd.format(fps, dur, out)
-    return cmd
-
-def black_mask(src, out, dur, fps):
-    cmd = 'ffmpeg -y -f lavfi -r {0:d} -i color=black:600x400:d={1:f} -pix_fmt yuv420p {2!s}'
-    cmd = cmd.format(fps, dur, out)
-    return cmd
-
-
-def stimuli_with_mask(src, fps, dur, out):
-    #cmds = ffmpeg.chain([black_mask, ffmpeg.concat],
-    #                    [(dur, fps), (src, False)],
-    #                    src, out, 'e')
-    cmds = ffmpeg.chain([black_mask, ffmpeg.concat],
-                        [(dur, fps), (src, False)],
-                        src, out, 'e')
-    ffmpeg.run_cmd(cmds)
+import ffmpeg_stream
+import mask_cache
+from job_scheduler import Job, run_jobs
+
+def stimuli_with_mask(src, fps, dur, out, masks, res, kind = 'black'):
+    """ Prepends a cached mask to `src` """
+    mask = masks.get(kind, dur, fps, res)
+    mask_cache.concat([mask, src], out + '.mp4')
+
+def sequential_stimuli(src_path, out_paths, timings, fps, dur, masks, res,
+                       kind = 'black'):
+    """ Encodes a continuous movie per time point and then adds a mask.
+    """
+    for out_path, point in zip(out_paths, timings):
+        # Create continous video
+        out_cont = out_path + '_continous'
+        ffmpeg.continous_movie(src_path, out_cont,
+                               vframes = point)
+
+        # add mask
+        stimuli_with_mask(out_cont + '.mp4', fps, dur, out_path, masks, res,
+                          kind)
 
 def main():
 
@@ -45,6 +48,23 @@ def main():
     )
     parser.add_argument('dataset', type = str,
                         help = 'Path to dataset')
+    parser.add_argument('--pipeline', type = str, default = 'stream',
+                        choices = ['stream', 'sequential'],
+                        help = 'Cut all timings of a trial in one ffmpeg ' +\
+                        'pass or encode each one separately')
+    parser.add_argument('--resolution', type = int, nargs = 2,
+                        default = (600, 400),
+                        help = 'Resolution of renderings')
+    parser.add_argument('--jobs', type = int,
+                        default = len(os.sched_getaffinity(0)),
+                        help = 'Number of concurrent ffmpeg jobs')
+    parser.add_argument('--retries', type = int, default = 1,
+                        help = 'Number of retries for a failed job')
+    parser.add_argument('--dry_run', action = 'store_true',
+                        help = 'Print the jobs without running them')
+    parser.add_argument('--mask', type = str, default = 'black',
+                        choices = ['black', 'noise'],
+                        help = 'Mask shown before each stimulus')
     args = parser.parse_args()
 
     dataset = Exp1Dataset(args.dataset)
@@ -59,24 +79,48 @@ def main():
 
     render_path = os.path.join('/renders', base_path)
 
+    fps = 60
+    dur = 0.250
+    masks = mask_cache.MaskCache(os.path.join(movie_dir, 'masks'))
+    jobs = []
+    if args.pipeline == 'sequential':
+        # every stimulus shares this clip
+        mask_args = (args.mask, dur, fps, args.resolution)
+        jobs.append(Job('mask', masks.get, mask_args,
+                        desc = masks.path(*mask_args)))
+
     for i in range(len(dataset)):
     #for i in range(1):
         _, _, timings = dataset[i]
+        timings = [int(t) for t in timings]
         src_path = os.path.join(render_path, str(i), 'render',
                                 '%d.png')
-        for cond, point in enumerate(timings):
-            out_path = '{0:d}_t-{1:d}'.format(i, cond)
-            out_path = os.path.join(movie_dir, out_path)
-
-
-            # Create continous video
-            out_cont = out_path + '_continous'
-            ffmpeg.continous_movie(src_path, out_cont,
-                                   vframes = point)
-
-            # add mask
-            dur = 0.250
-            stimuli_with_mask(out_cont + '.mp4', 60, dur, out_path)
+        out_paths = [os.path.join(movie_dir, '{0:d}_t-{1:d}'.format(i, cond))
+                     for cond in range(len(timings))]
+
+        if args.pipeline == 'stream':
+            cmd = ffmpeg_stream.stream_cmd(src_path,
+                                           [p + '.mp4' for p in out_paths],
+                                           timings, fps = fps,
+                                           mask = args.mask, dur = dur,
+                                           res = args.resolution)
+            jobs.append(Job(str(i), ffmpeg_stream.run, (cmd,),
+                            desc = ' '.join(map(shlex.quote, cmd))))
+        else:
+            for cond, (out_path, point) in enumerate(zip(out_paths, timings)):
+                job_args = (src_path, [out_path], [point], fps, dur,
+                            masks, args.resolution, args.mask)
+                desc = '{0!s}[:{1:d}] + mask -> {2!s}.mp4'.format(
+                    src_path, point, out_path)
+                jobs.append(Job('{0:d}_t-{1:d}'.format(i, cond),
+                                sequential_stimuli, job_args,
+                                deps = ['mask'], desc = desc))
+
+    result = run_jobs(jobs, workers = args.jobs, retries = args.retries,
+                      dry_run = args.dry_run)
+    if result['failed'] or result['skipped']:
+        msg = '{0:d} jobs failed and {1:d} were skipped'
+        sys.exit(msg.format(len(result['failed']), len(result['skipped'])))
 
 
 
@@ -7,54 +7,211 @@ import sys
 import json
 import h5py
 import argparse
+import threading
 import subprocess
 import numpy as np
 from pprint import pprint
 from itertools import repeat
 
-from slurmpy import sbatch
-
-from rbw.utils.render import render
+from rbw.utils.encoders import NpEncoder
 
 from galileo_ramp.exp1_dataset import Exp1Dataset
 
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+import trace_store
+
+import executor
+
 blender_exec = '/blender/blender'
 base_path = '/project/galileo_ramp/blend/'
 render_path = base_path + 'render.py'
 blend_path = base_path + 'new_scene.blend'
+camera_theta = 1.5*np.pi
+
+def blender_cmd(res, mode, gpu = False, bulk = False, quality = None):
+    """ Command line of `render.py` shared by all render calls """
+    cmd = [blender_exec, '-noaudio', '--background', blend_path,
+           '--python', render_path, '--',
+           '--render_mode', mode,
+           '--resolution', str(res[0]), str(res[1]),
+           '--theta', str(camera_theta)]
+    if gpu:
+        cmd += ['--gpu']
+    if bulk:
+        cmd += ['--bulk_trace']
+    if not quality is None:
+        cmd += ['--quality', quality]
+    return cmd
 
 def render_trace(scene, trace, out, res, mode,
-                 snapshot = False, gpu = False):
+                 snapshot = False, gpu = False, bulk = False,
+                 quality = None):
     """ Render tower with randomly sampled camera angle.
     For a given scene pair, render either the congruent or incongruent
     tower with the same camera angle.
     Call to this function preserves state. Will not re-sample camera angle
     or re-render completed frames.
+    The trace is passed to blender as a binary trace (see `store_trace`).
     Arguments:
-        src   (str): Path to dataset hdf5 file
-        trial (int): Trial to render
+        scene (dict): The scene to render
+        trace (dict): The physics trace of the scene
         out   (str): Directory to save trial renderings
     Returns
         Nothing
     """
+    os.makedirs(out, exist_ok = True)
+    scene_path = os.path.join(out, 'scene.json')
+    with open(scene_path, 'w') as f:
+        json.dump({'scene' : scene}, f, cls = NpEncoder)
+    cmd = blender_cmd(res, mode, gpu, bulk, quality)
+    cmd += ['--scene', scene_path,
+            '--trace', store_trace(trace, out),
+            '--out', out]
+    if snapshot:
+        cmd += ['--frames', '0']
+    subprocess.run(cmd, check = True)
 
-    # Render
-    kwargs = dict(
-        scene = {'scene': scene},
-        trace = trace,
-        out = out,
-        render_mode = mode,
-        resolution = res,
-        theta = 1.5*np.pi,
-        render = render_path,
-        blend = blend_path,
-        exec = blender_exec
-    )
+
+def render_server(res, mode, gpu = False, bulk = False,
+                  cores = None, pin = False, quality = None):
+    """ Starts a persistent blender process that renders jobs from stdin.
+
+    The blend file is loaded once and reused for every job passed
+    to `submit_job`.
+
+    Arguments:
+        res (tuple): Resolution for images
+        mode (str): Rendering mode
+        cores (list, optional): CPUs reserved for this server.
+            Sets the number of render threads.
+        pin (bool): Restrict the server to `cores`
+    Returns
+        A `subprocess.Popen` for the render server. Its stdout is piped
+        (see `read_status`).
+    """
+    cmd = blender_cmd(res, mode, gpu, bulk, quality) + ['--serve']
+    preexec = None
+    if not cores is None:
+        cmd += ['--threads', str(len(cores))]
+        if pin:
+            preexec = lambda: os.sched_setaffinity(0, cores)
+    return subprocess.Popen(cmd, stdin = subprocess.PIPE,
+                            stdout = subprocess.PIPE,
+                            universal_newlines = True,
+                            preexec_fn = preexec)
+
+def read_status(server, reports):
+    """ Collects the `JOB <status> <json>` lines of a render server.
+
+    Other output is passed through to stdout. Runs until the server
+    closes its stdout.
+
+    Arguments:
+        server (subprocess.Popen): A server from `render_server`
+        reports (list): Receives `(status, report)` for each job
+    """
+    for line in server.stdout:
+        if line.startswith('JOB '):
+            _, status, report = line.rstrip('\n').split(' ', 2)
+            reports.append((status, json.loads(report)))
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+def store_trace(trace, out):
+    """ Writes a trial's trace as a binary trace in `out`.
+
+    Returns
+        The path to the trace
+    """
+    os.makedirs(out, exist_ok = True)
+    path = os.path.join(out, 'trace' + trace_store.EXT)
+    trace_store.write(path, trace)
+    return path
+
+def submit_job(server, scene, trace, out, snapshot = False, shard = None):
+    """ Queues a trial on a server started with `render_server`.
+
+    Arguments:
+        server (subprocess.Popen): The render server
+        trace (dict or str): The trace or a path to it
+        out   (str): Directory to save trial renderings
+        shard (tuple, optional): Only render block `k` of `n` frames
+    """
+    job = dict(scene = scene, trace = trace, out = out)
     if snapshot:
-        kwargs['frames'] = [0]
-    if gpu:
-        kwargs['gpu'] = None
-    render(**kwargs)
+        job['frames'] = [0]
+    if not shard is None:
+        job['shard'] = shard
+    server.stdin.write(json.dumps(job, cls = NpEncoder) + '\n')
+    server.stdin.flush()
+
+def partition_cores(workers):
+    """ Splits the available CPUs into `workers` disjoint groups. """
+    cores = sorted(os.sched_getaffinity(0))
+    workers = max(1, min(workers, len(cores)))
+    return [list(map(int, c)) for c in np.array_split(cores, workers)]
+
+def render_local(dataset, idxs, out, args):
+    """ Renders trials across `args.workers` local render servers.
+
+    A single trial is split into contiguous frame shards, one per
+    worker. Otherwise whole trials are dealt out to the workers in
+    turn. Either way, frames land in `<out>/<idx>/render/<i>.png`.
+
+    Arguments:
+        dataset (Exp1Dataset): Source of scenes and traces
+        idxs (list): Trials to render
+        out   (str): Directory to save trial renderings
+    Raises
+        RuntimeError if a job failed or a server exited early
+    """
+    servers = [render_server(args.resolution, args.mode, args.gpu,
+                             args.bulk_trace, cores = c, pin = args.pin,
+                             quality = args.quality)
+               for c in partition_cores(args.workers)]
+    n = len(servers)
+    # read statuses while submitting so that no pipe fills up
+    reports = [[] for _ in servers]
+    readers = [threading.Thread(target = read_status, args = (s, r))
+               for s, r in zip(servers, reports)]
+    for reader in readers:
+        reader.start()
+    jobs = [0] * n
+    if len(idxs) == 1:
+        scene, trace, _ = dataset[idxs[0]]
+        scene_out = os.path.join(out, str(idxs[0]))
+        trace = store_trace(trace, scene_out)
+        for k, server in enumerate(servers):
+            submit_job(server, scene, trace, scene_out, args.snapshot,
+                       shard = (k, n))
+            jobs[k] += 1
+    else:
+        for i, idx in enumerate(idxs):
+            scene, trace, _ = dataset[idx]
+            scene_out = os.path.join(out, str(idx))
+            trace = store_trace(trace, scene_out)
+            submit_job(servers[i % n], scene, trace, scene_out,
+                       args.snapshot)
+            jobs[i % n] += 1
+
+    for server in servers:
+        server.stdin.close()
+    errors = []
+    for k, (server, reader) in enumerate(zip(servers, readers)):
+        server.wait()
+        reader.join()
+        failed = [r['out'] for status, r in reports[k] if status != 'done']
+        if failed:
+            errors.append('server {0:d} failed {1!s}'.format(k, failed))
+        if len(reports[k]) < jobs[k] or server.returncode != 0:
+            msg = 'server {0:d} exited with {1:d} after {2:d} of {3:d} jobs'
+            errors.append(msg.format(k, server.returncode, len(reports[k]),
+                                     jobs[k]))
+    if errors:
+        raise RuntimeError('Rendering failed: ' + '; '.join(errors))
 
 
 def main():
@@ -74,14 +231,31 @@ def main():
                         choices = ['batch', 'local'],
                         help = 'submission modes')
     parser.add_argument('--mode', type = str, default = 'none',
-                        choices = ['default', 'none',],
+                        choices = ['default', 'composite', 'none',],
                         help = 'rendering mode.')
     parser.add_argument('--snapshot', action = 'store_true',
                         help = 'Only render first frame of each scene')
     parser.add_argument('--batch', type = int, default = 10,
                         help = 'Size of sbatch array.')
+    parser.add_argument('--backend', type = str, default = 'slurm',
+                        choices = executor.BACKENDS,
+                        help = 'Where to run `--run batch` jobs')
+    parser.add_argument('--jobs', type = int,
+                        help = 'Most concurrent `--run batch` jobs ' +\
+                        '(local and dask)')
     parser.add_argument('--gpu', action = 'store_true',
                         help = 'Use CUDA rendering')
+    parser.add_argument('--bulk_trace', action = 'store_true',
+                        help = 'Bake traces into keyframes in one pass')
+    parser.add_argument('--server', action = 'store_true',
+                        help = 'Render all trials in one blender process')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'Number of local blender servers')
+    parser.add_argument('--pin', action = 'store_true',
+                        help = 'Pin each local server to its own cores')
+    parser.add_argument('--quality', type = str,
+                        choices = ['draft', 'preview', 'final'],
+                        help = 'Render quality preset')
 
     args = parser.parse_args()
 
@@ -96,12 +270,20 @@ def main():
         submit_sbatch(args)
     else:
         dataset = Exp1Dataset(args.src)
-        if not args.idx is None:
+        if args.server or args.workers > 1:
+            if args.idx is None:
+                idxs = list(range(len(dataset)))
+            else:
+                idxs = [args.idx]
+            render_local(dataset, idxs, out, args)
+
+        elif not args.idx is None:
             scene_out = os.path.join(out, str(args.idx))
             scene, trace, _ = dataset[args.idx]
             print(scene)
             render_trace(scene, trace, scene_out, args.resolution,
-                            args.mode, args.snapshot, args.gpu)
+                            args.mode, args.snapshot, args.gpu,
+                            args.bulk_trace, args.quality)
 
 
         else:
@@ -109,10 +291,13 @@ def main():
                 scene_out = os.path.join(out, str(idx))
                 scene, trace, _ = dataset[idx]
                 render_trace(scene, trace, scene_out, args.resolution,
-                             args.mode, args.snapshot, args.gpu)
+                             args.mode, args.snapshot, args.gpu,
+                             args.bulk_trace, args.quality)
 
 def submit_sbatch(args, chunks = 210):
-    """ Helper function that submits sbatch jobs.
+    """ Helper function that submits a batch of render jobs.
+
+    Jobs run on `args.backend` (see `executor`).
 
     Arguments:
         src (str): Path to dataset
@@ -131,6 +316,10 @@ def submit_sbatch(args, chunks = 210):
         kwargs += ['--snapshot',]
     if args.gpu:
         kwargs += ['--gpu',]
+    if args.bulk_trace:
+        kwargs += ['--bulk_trace',]
+    if not args.quality is None:
+        kwargs += ['--quality {0!s}'.format(args.quality)]
 
     interpreter = '#!/bin/bash'
     extras = []
@@ -145,11 +334,12 @@ def submit_sbatch(args, chunks = 210):
     path = os.path.realpath(__file__)
     path = os.path.join('/project/scripts/stimuli', os.path.basename(path))
     func = 'bash {0!s}/run.sh {1!s}'.format(os.getcwd(), path)
-    batch = sbatch.Batch(interpreter, func, tasks, kwargs, extras,
-                         resources)
+    # completed frames are skipped by `render_trace`
+    batch = executor.Batch(interpreter, func, tasks, kwargs, extras,
+                           resources, backend = args.backend)
     print("Template Job:")
     print('\n'.join(batch.job_file(chunk=njobs)))
-    batch.run(n = njobs, check_submission = True)
+    batch.run(n = njobs, check_submission = True, workers = args.jobs)
 
 if __name__ == '__main__':
    main()
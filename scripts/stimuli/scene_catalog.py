@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+""" A single-file catalog of scenes.
+
+Scenes are stored in one HDF5 file with two views:
+
+* `scenes`: one json string per scene, for random access and
+  for exporting the usual `<i>.json` files.
+* `objects`: a columnar table with a row per object in each scene.
+  Nested properties are flattened (ie. `physics_density`, `dims_0`).
+
+Example::
+
+    catalog = SceneCatalog('/scenes/exp1/scenes.h5')
+    scene = catalog[3]
+    iron_pucks = catalog.query(appearance = 'Iron', shape = 'Puck',
+                               initial_pos = 1.65)
+"""
+
+import os
+import json
+import glob
+import argparse
+
+import h5py
+import numpy as np
+import pandas as pd
+
+CATALOG = 'scenes.h5'
+
+def flatten_object(obj, prefix = ''):
+    """ Flattens nested dictionaries and arrays into scalar columns """
+    row = {}
+    for k, v in obj.items():
+        key = prefix + k
+        if isinstance(v, dict):
+            row.update(flatten_object(v, key + '_'))
+        elif isinstance(v, (list, tuple, np.ndarray)):
+            for i, x in enumerate(np.ravel(v)):
+                row['{0!s}_{1:d}'.format(key, i)] = x
+        else:
+            row[key] = v
+    return row
+
+def object_table(scenes):
+    """ Returns a `pd.DataFrame` with a row per object.
+
+    Arguments:
+        scenes (list): Scene dictionaries
+    """
+    rows = []
+    for i, scene in enumerate(scenes):
+        init = scene.get('initial_pos', {})
+        for name, obj in sorted(scene['objects'].items()):
+            row = {'scene' : i, 'object' : name}
+            if name in init:
+                row['initial_pos'] = init[name]
+            row.update(flatten_object(obj))
+            rows.append(row)
+    return pd.DataFrame.from_records(rows)
+
+def write(path, scenes, encoder = None):
+    """ Writes scenes to a catalog.
+
+    Arguments:
+        path (str): Path to the catalog
+        scenes (list): Serialized scenes (`RampWorld.serialize()`)
+        encoder (json.JSONEncoder, optional): Encoder for the scenes
+    """
+    strs = [json.dumps(s, cls = encoder) for s in scenes]
+    # round trip so that the table sees plain python types
+    df = object_table([json.loads(s) for s in strs])
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('scenes', data = strs,
+                         dtype = h5py.string_dtype())
+        objects = f.create_group('objects')
+        for col in df.columns:
+            values = df[col]
+            # strings are `object` or (pandas >= 3) `str` columns
+            if not pd.api.types.is_numeric_dtype(values):
+                values = values.fillna('').astype(str).tolist()
+                objects.create_dataset(col, data = values,
+                                       dtype = h5py.string_dtype())
+            else:
+                objects.create_dataset(col, data = values.to_numpy())
+        f.attrs['trials'] = len(strs)
+
+class SceneCatalog:
+
+    """
+    Read access to a catalog written by `write`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = h5py.File(path, 'r')
+        self._objects = None
+
+    def __len__(self):
+        return int(self._file.attrs['trials'])
+
+    def __getitem__(self, idx):
+        """ Returns the scene dictionary at `idx` """
+        return json.loads(self._file['scenes'].asstr()[idx])
+
+    @property
+    def objects(self):
+        """ The object table as a `pd.DataFrame` """
+        if self._objects is None:
+            cols = {}
+            for k, d in self._file['objects'].items():
+                if h5py.check_string_dtype(d.dtype) is None:
+                    cols[k] = d[()]
+                else:
+                    cols[k] = d.asstr()[()]
+            self._objects = pd.DataFrame(cols)
+        return self._objects
+
+    def query(self, **kwargs):
+        """ Returns the objects whose columns match each keyword.
+
+        Floating point columns are compared with `np.isclose`.
+        """
+        df = self.objects
+        mask = np.ones(len(df), dtype = bool)
+        for k, v in kwargs.items():
+            col = df[k].to_numpy()
+            if np.issubdtype(col.dtype, np.floating):
+                mask &= np.isclose(col, v)
+            else:
+                mask &= col == v
+        return df[mask]
+
+    def export(self, out):
+        """ Writes each scene as `<out>/<i>.json` along with `info` """
+        os.makedirs(out, exist_ok = True)
+        for i in range(len(self)):
+            p = os.path.join(out, '{0:d}.json'.format(i))
+            with open(p, 'w') as f:
+                json.dump({'scene' : self[i]}, f, indent = 2)
+        with open(os.path.join(out, 'info'), 'w') as f:
+            json.dump({'trials' : len(self)}, f)
+
+def from_json(src):
+    """ Loads the scenes of a directory of `<i>.json` files in order """
+    paths = glob.glob(os.path.join(src, '*.json'))
+    paths = sorted(paths, key = lambda p: int(os.path.basename(p)[:-5]))
+    scenes = []
+    for p in paths:
+        with open(p, 'r') as f:
+            scenes.append(json.load(f)['scene'])
+    return scenes
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = 'Converts between scene catalogs and json',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('mode', type = str, choices = ['build', 'export'],
+                        help = 'build a catalog from json or export json')
+    parser.add_argument('src', type = str,
+                        help = 'Scene directory (build) or catalog (export)')
+    parser.add_argument('out', type = str,
+                        help = 'Catalog (build) or scene directory (export)')
+    args = parser.parse_args()
+
+    if args.mode == 'build':
+        write(args.out, from_json(args.src))
+    else:
+        SceneCatalog(args.src).export(args.out)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+""" Benchmarks Markov stepping against a full trace of a ramp scene.
+
+Each method simulates `T` frames of the same scene in its own client:
+
+* `full`: one `ramp_physics.simulate` call (the reference trace)
+* `python`: each frame the state is read into Python and written back
+  before stepping, as the Markov model did through `update_world`
+* `markov_k`: `ramp_physics.MarkovSim` advancing `k` frames per call,
+  reading positions after each call
+
+Markov runs snapshot and restore the state only at branch points (every
+`--branch` frames), as a particle filter does when it resamples. That
+time is reported separately (`snapshot_seconds`) from stepping, since
+each `saveState` costs more than a few frames of stepping.
+
+Throughput (frames per second, with and without snapshots) and drift
+(max L2 distance in position from the reference) are reported for each.
+"""
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pybullet as pb
+
+import ramp_physics
+
+def run_full(world, frames):
+    state, _ = ramp_physics.simulate(world.client, world.objs, frames)
+    return state['pos'], 0.
+
+def run_python(world, frames):
+    """ Pushes the state through Python between every frame """
+    client = world.client
+    sim = ramp_physics.MarkovSim(client, world.objs)
+    pos = np.zeros((frames, len(world.objs), 3))
+    for t in range(frames):
+        state = sim.read(sim.fields)
+        for i, o in enumerate(world.objs):
+            pb.resetBasePositionAndOrientation(o, state['pos'][i],
+                                               state['orn'][i],
+                                               physicsClientId = client)
+            pb.resetBaseVelocity(o, state['lin_vel'][i],
+                                 state['ang_vel'][i],
+                                 physicsClientId = client)
+        sim.step(1)
+        pos[t] = sim.read()['pos']
+    return pos, 0.
+
+def run_markov(world, frames, k, branch = 0):
+    """ Steps `k` frames per call, branching every `branch` frames.
+
+    Every one of the `frames` is simulated, even if `k` does not divide
+    it.
+
+    At a branch point the state is snapshot, restored, and released, as
+    when a particle is rewound. No snapshots are taken if `branch` is 0.
+
+    Returns
+        The positions and the time spent on snapshots
+    """
+    sim = ramp_physics.MarkovSim(world.client, world.objs)
+    pos = np.full((frames, len(world.objs), 3), np.nan)
+    snap = 0.
+    last = 0
+    while sim.t < frames:
+        if branch > 0 and sim.t - last >= branch:
+            t_0 = time.time()
+            handle = sim.snapshot()
+            sim.restore(handle)
+            sim.release(handle)
+            snap += time.time() - t_0
+            last = sim.t
+        # the last call covers the remaining `frames % k`
+        sim.step(min(k, frames - sim.t))
+        pos[sim.t - 1] = sim.read()['pos']
+    return pos, snap
+
+def timed(f, params, *args):
+    """ Runs `f` on a new world, excluding setup from the timing """
+    world = ramp_physics.RampClient()
+    world.load(**params)
+    t_0 = time.time()
+    pos, snap = f(world, *args)
+    dur = time.time() - t_0
+    world.close()
+    return pos, dur, snap
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = 'Benchmarks Markov stepping of ramp physics',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--frames', type = int, default = 240,
+                        help = 'Number of frames to simulate')
+    parser.add_argument('--k', type = int, nargs = '+',
+                        default = [1, 4, 12],
+                        help = 'Frames per Markov step')
+    parser.add_argument('--branch', type = int, default = 12,
+                        help = 'Frames between snapshots of Markov ' +\
+                        'runs (0 for none)')
+    parser.add_argument('--density_ratio', type = float, default = 2.0)
+    parser.add_argument('--friction', type = float, default = 0.2)
+    parser.add_argument('--positions', type = float, nargs = 2,
+                        default = [0.2, 1.2])
+    parser.add_argument('--out', type = str,
+                        help = 'Optional csv for the results')
+    args = parser.parse_args()
+
+    params = {'density_ratio' : args.density_ratio,
+              'frictions' : (args.friction,) * 2,
+              'positions' : args.positions}
+    full, dur, snap = timed(run_full, params, args.frames)
+    runs = [('full', full, dur, snap)]
+    runs.append(('python',) + timed(run_python, params, args.frames))
+    for k in args.k:
+        runs.append(('markov_{0:d}'.format(k),) +
+                    timed(run_markov, params, args.frames, k, args.branch))
+
+    rows = []
+    for name, pos, dur, snap in runs:
+        err = np.linalg.norm(pos - full, axis = -1)
+        rows.append({'method' : name,
+                     'seconds' : dur,
+                     'snapshot_seconds' : snap,
+                     'frames_per_sec' : args.frames / dur,
+                     'step_frames_per_sec' : args.frames / (dur - snap),
+                     'drift' : np.nanmax(err)})
+    df = pd.DataFrame.from_records(rows)
+    print(df.to_string(index = False))
+    if not args.out is None:
+        df.to_csv(args.out, index = False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+""" Profiles the time between collisions over a grid of ramp scenes.
+
+Each point in the grid over (position, density ratio, friction, shape)
+is simulated by a pool of headless pybullet clients, each keeping
+the static ramp world between scenes. Simulations stop
+as soon as the second collision (onset of contact) is observed.
+
+The results are written as a tidy csv with a row per scene that
+`plot_collision_profile.py --table` consumes.
+"""
+
+import os
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+import ramp_physics
+from collisions import onsets, collision_delta
+
+_world = None
+_client = None
+
+def _init_worker():
+    global _world
+    _world = ramp_physics.RampClient()
+
+def _init_batch_worker():
+    global _client
+    _client = ramp_physics.init_client()
+
+def sweep_grid(positions, density_ratios, frictions, shapes,
+               table_position = 1.2):
+    """ Returns the cartesian product of scene parameters as a list of dicts """
+    grid = itertools.product(positions, density_ratios, frictions, shapes)
+    return [{'position' : p, 'density_ratio' : d, 'friction' : f,
+             'shape' : s, 'table_position' : table_position}
+            for (p, d, f, s) in grid]
+
+def scene_params(point):
+    """ `ramp_physics.add_objects` arguments of a grid point """
+    return {'density_ratio' : point['density_ratio'],
+            'frictions' : (point['friction'],) * 2,
+            'positions' : (point['position'], point['table_position']),
+            'shape' : point['shape']}
+
+def run_point(point, frames = 900):
+    """ Simulates a single grid point in the worker's client.
+
+    Returns
+        A row with the grid point, the first frames of the first two
+        collisions, and the time between them in ms (`nan` if not
+        observed).
+    """
+    objs = _world.load(**scene_params(point))
+    state, _ = ramp_physics.simulate(_world.client, objs, frames,
+                                     events = [ramp_physics.nth_contact(2)])
+    return collision_row(point, state['contacts'])
+
+def run_batch(points, frames = 900):
+    """ Simulates grid points together in one world (see `run_point`) """
+    objs, offsets = ramp_physics.ramp_batch(
+        _client, [scene_params(p) for p in points])
+    state = ramp_physics.simulate_batch(_client, objs, offsets, frames,
+                                        max_collisions = 2)
+    return [collision_row(p, c) for p, c in zip(points, state['contacts'])]
+
+def collision_row(point, contacts):
+    row = dict(point)
+    row['first'], row['second'] = onsets(contacts, 2, edges = True)
+    row['duration'] = collision_delta(contacts, edges = True)
+    row['frames'] = len(contacts)
+    return row
+
+def run_sweep(grid, frames = 900, workers = None, batch = None):
+    """ Runs each grid point across a pool of pybullet clients.
+
+    Arguments:
+        batch (int, optional): Simulate this many grid points per world
+    Returns
+        A `pd.DataFrame` with a row per grid point
+    """
+    if batch is None:
+        with mp.Pool(workers, initializer = _init_worker) as pool:
+            args = [(p, frames) for p in grid]
+            rows = pool.starmap(run_point, args, chunksize = 4)
+    else:
+        with mp.Pool(workers, initializer = _init_batch_worker) as pool:
+            args = [(grid[i:i + batch], frames)
+                    for i in range(0, len(grid), batch)]
+            rows = sum(pool.starmap(run_batch, args), [])
+    return pd.DataFrame.from_records(rows)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = 'Sweeps collision timings over ramp scenes',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('out', type = str,
+                        help = 'Path to save the csv table')
+    parser.add_argument('--positions', type = float, nargs = '+',
+                        default = np.linspace(0.1, 0.9, 9).tolist(),
+                        help = 'Initial positions of `A` on the ramp')
+    parser.add_argument('--density_ratios', type = float, nargs = '+',
+                        default = [0.25, 0.5, 1.0, 2.0, 4.0],
+                        help = 'Density of `A` relative to `B`')
+    parser.add_argument('--frictions', type = float, nargs = '+',
+                        default = [0.2, 0.3, 0.4],
+                        help = 'Friction of both objects')
+    parser.add_argument('--shapes', type = str, nargs = '+',
+                        default = ['Block', 'Puck'],
+                        choices = ['Block', 'Puck'],
+                        help = 'Shapes of `A`')
+    parser.add_argument('--table_position', type = float, default = 1.2,
+                        help = 'Initial position of `B` on the table')
+    parser.add_argument('--frames', type = int, default = 900,
+                        help = 'Maximum number of frames to simulate')
+    parser.add_argument('--batch', type = int,
+                        help = 'Simulate this many scenes per pybullet ' +\
+                        'world (see `ramp_physics.ramp_batch`)')
+    parser.add_argument('--workers', type = int, default = os.cpu_count(),
+                        help = 'Number of pybullet clients')
+    args = parser.parse_args()
+
+    grid = sweep_grid(args.positions, args.density_ratios, args.frictions,
+                      args.shapes, args.table_position)
+    t_0 = time.time()
+    df = run_sweep(grid, args.frames, args.workers, args.batch)
+    elapsed = time.time() - t_0
+    msg = 'Simulated {0:d} scenes ({1:d} frames) in {2:.1f}s'
+    print(msg.format(len(df), int(df['frames'].sum()), elapsed))
+    df.to_csv(args.out, index = False)
+
+if __name__ == '__main__':
+    main()
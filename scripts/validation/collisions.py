@@ -0,0 +1,93 @@
+""" Collision onsets from contact arrays.
+
+Contacts are boolean `...xTxP` arrays (frames by object pairs), as
+returned by the forward model or `ramp_physics.simulate`, or the same
+packed into a bitset along time with `pack`.
+
+Example::
+
+    # time between the first two collisions of each trace
+    delta = collision_delta(contacts, edges = True)
+    # first frame of contact for each pair in each trace
+    frames = first_contacts(pack(contacts), packed = True)
+"""
+import numpy as np
+
+# ms per frame at 60 fps
+FRAME_MS = 100. / 6.
+
+# position of the first set bit in each byte (big endian; 8 if none)
+_first_bit = np.array([8 if b == 0 else 7 - int(np.log2(b))
+                       for b in range(256)], dtype = np.int64)
+
+def pack(contacts):
+    """ Packs `...xTxP` contacts into `...xceil(T/8)xP` bytes """
+    return np.packbits(np.asarray(contacts, dtype = bool), axis = -2)
+
+def first_contacts(contacts, packed = False):
+    """ Returns the first frame of contact for each pair.
+
+    Arguments:
+        contacts (np.ndarray): `...xTxP` contacts or their `pack`
+        packed (bool): Whether `contacts` is packed
+    Returns
+        A `...xP` array of frames (-1 if the pair never touches)
+    """
+    contacts = np.asarray(contacts)
+    if packed:
+        nonzero = contacts != 0
+        byte = np.argmax(nonzero, axis = -2)
+        first = np.take_along_axis(contacts, byte[..., None, :],
+                                   axis = -2)[..., 0, :]
+        frame = 8 * byte + _first_bit[first]
+        return np.where(nonzero.any(axis = -2), frame, -1)
+    frame = np.argmax(contacts, axis = -2)
+    return np.where(contacts.any(axis = -2), frame, -1)
+
+def rising(collided):
+    """ Frames of `...xT` booleans where they turn true """
+    previous = np.zeros_like(collided)
+    previous[..., 1:] = collided[..., :-1]
+    return collided & ~previous
+
+def onsets(contacts, n = 2, packed = False, edges = False):
+    """ Returns the first `n` frames with contact between any pair.
+
+    An impact usually lasts several frames, so pass `edges` to count
+    collisions (frames where contact starts) instead.
+
+    Arguments:
+        contacts (np.ndarray): `...xTxP` contacts or their `pack`
+        n (int): Number of frames
+        packed (bool): Whether `contacts` is packed
+        edges (bool): Only count frames where contact starts
+    Returns
+        A `...xn` array of frames (-1 where there are fewer than `n`)
+    """
+    contacts = np.asarray(contacts)
+    if packed:
+        merged = np.bitwise_or.reduce(contacts, axis = -1)
+        collided = np.unpackbits(merged, axis = -1).astype(bool)
+    else:
+        collided = contacts.any(axis = -1)
+    if edges:
+        collided = rising(collided)
+    count = np.cumsum(collided, axis = -1)
+    ks = np.arange(1, n + 1)
+    reached = count[..., None, :] >= ks[:, None]
+    frame = np.argmax(reached, axis = -1)
+    return np.where(reached.any(axis = -1), frame, -1)
+
+def collision_delta(contacts, packed = False, edges = False):
+    """ Time (ms) between the first two frames with contact.
+
+    See `onsets` for `edges`.
+
+    Returns
+        A float for a single `TxP` trace, otherwise an array over the
+        leading dimensions (`nan` where there are fewer than two)
+    """
+    frames = onsets(contacts, 2, packed, edges)
+    delta = (frames[..., 1] - frames[..., 0]) * FRAME_MS
+    delta = np.where(frames[..., 1] < 0, np.nan, delta)
+    return delta.item() if delta.ndim == 0 else delta
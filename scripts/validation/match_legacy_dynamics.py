@@ -4,6 +4,7 @@ Attempts to find physical settings that matches
 the current forward model to traces in the legacy model.
 """
 import os
+import sys
 import glob
 import json
 import argparse
@@ -13,6 +14,13 @@ import numpy as np
 from galileo_ramp.utils import config
 from galileo_ramp.inference.execute import initialize
 
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+import trace_store
+from scene_catalog import SceneCatalog
+
 CONFIG = config.Config()
 
 root = CONFIG['PATHS', 'root']
@@ -20,7 +28,7 @@ module_path = os.path.join(root, 'inference',
                            'queries', 'match_legacy_physics.jl')
 inference = initialize(module_path)
 
-def run_search(scene_json, scene_pos, out):
+def run_search(scene, scene_pos, out):
     """Runs a particle filter over the tower designated by the trial index
 
     Arguments:
@@ -31,10 +39,12 @@ def run_search(scene_json, scene_pos, out):
     Returns:
         A `dict` containing the inference trace.
     """
-    positions = np.load(scene_pos)
-    positions = np.transpose(positions, (1, 0, 2))
-    with open(scene_json, 'r') as f:
-        scene_data = json.load(f)['scene']
+    positions = np.asarray(trace_store.load_positions(scene_pos))
+    if isinstance(scene, str):
+        with open(scene, 'r') as f:
+            scene_data = json.load(f)['scene']
+    else:
+        scene_data = scene
 
     inference(scene_data, positions, out)
 
@@ -46,12 +56,20 @@ def main():
         'the galileo ball-ramp-world.',
         formatter_class = argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument('trial', type = str, help = 'path to scene file')
+    parser.add_argument('trial', type = str,
+                        help = 'path to scene file or index in `--catalog`')
+    parser.add_argument('--catalog', type = str,
+                        help = 'Scene catalog to read the trial from')
+    parser.add_argument('--positions', type = str,
+                        help = 'Binary trace or `_pos.npy` to match. ' +\
+                        'Defaults to the `_pos.npy` next to the scene')
     # misc
     parser.add_argument('--out', type = str, help = 'directory to save traces',
                         default =  'match_legacy')
 
     args = parser.parse_args()
+    if not args.catalog is None and args.positions is None:
+        parser.error('--positions is required with --catalog')
 
     print('Initializing inference run')
     # assign unique name if new run
@@ -65,11 +83,16 @@ def main():
 
     out_path = os.path.join(out, trial_name)
     print('Saving results in {0!s}'.format(out))
-    position_file = args.trial.replace('.json', '_pos.npy')
+    position_file = args.positions
+    if position_file is None:
+        position_file = args.trial.replace('.json', '_pos.npy')
+    scene = args.trial
+    if not args.catalog is None:
+        scene = SceneCatalog(args.catalog)[int(args.trial)]
     if os.path.isfile(out_path + '_trace.csv'):
         print('Inference already complete')
     else:
-        run_search(args.trial, position_file, out_path)
+        run_search(scene, position_file, out_path)
 
 
 if __name__ == '__main__':
@@ -16,11 +16,13 @@ is normalized by the average and variance of the entire pool.
 """
 
 import os
+import sys
 import json
 import glob
 import string
 import argparse
 import numpy as np
+import pandas as pd
 
 import matplotlib as mpl
 mpl.use('Agg')
@@ -31,24 +33,31 @@ from galileo_ramp.utils import config
 from galileo_ramp.world.scene import ramp
 from galileo_ramp.world.simulation import forward_model
 
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+from scene_catalog import SceneCatalog
+from collisions import collision_delta
+
 CONFIG = config.Config()
 
 
 def get_collisions(ramp_file):
     """ Returns the time between the first two collisions
 
-    Time in ms
+    Time in ms (`nan` if there are fewer than two)
+
+    Arguments:
+        ramp_file (str or dict): Path to a scene json or the scene
     """
-    with open(ramp_file, 'r') as f:
-        data = json.load(f)
-    state = forward_model.simulate(data['scene'], 900)
-    state = state[-1]
-    collided = np.sum(state, axis = -1) > 0
-    indeces = np.flatnonzero(collided)
-    print(ramp_file)
-    print(indeces)
-    delta = (indeces[1] - indeces[0])*(100./6.)
-    return delta
+    if isinstance(ramp_file, str):
+        with open(ramp_file, 'r') as f:
+            scene = json.load(f)['scene']
+    else:
+        scene = ramp_file
+    state = forward_model.simulate(scene, 900)
+    return collision_delta(state[-1])
 
 def plot_profile(positions, results, out):
     """ Creates a 2D binary histogram of viable mass/positions.
@@ -66,13 +75,44 @@ def plot_profile(positions, results, out):
     ax.set_xticklabels(positions)
     ax.set_xlim(0.25, len(positions) + 0.75)
     ax = axes[1]
-    ax.scatter(positions, np.min(results, axis = 1))
+    ax.scatter(positions, [np.min(r) for r in results])
     ax.axhline(300)
     ax.set_xlabel('Position')
     ax.set_ylabel('Minimum Duration (ms)')
     fig.savefig(out)
     plt.close(fig)
 
+def drop_missing(positions, durations):
+    """ Drops scenes without two collisions (`nan` durations).
+
+    Positions left without any scenes are dropped as well.
+
+    Returns
+        The positions, their durations, and the number of dropped scenes
+    """
+    kept_pos = []
+    kept = []
+    dropped = 0
+    for pos, ds in zip(positions, durations):
+        valid = [float(d) for d in ds if not np.isnan(d)]
+        dropped += len(ds) - len(valid)
+        if valid:
+            kept_pos.append(pos)
+            kept.append(valid)
+    return kept_pos, kept, dropped
+
+def profile_from_table(df):
+    """ Groups a sweep table (see `collision_sweep.py`) by position.
+
+    Returns
+        The positions and a list of durations for each position
+    """
+    positions = []
+    durations = []
+    for pos, group in df.groupby('position'):
+        positions.append(pos)
+        durations.append(group['duration'].tolist())
+    return positions, durations
 
 def main():
 
@@ -82,6 +122,13 @@ def main():
     )
     parser.add_argument('on_ramp', type = int,
                         help = 'Number of balls on ramp')
+    parser.add_argument('--catalog', type = str,
+                        help = 'Scene catalog to profile instead of ' +\
+                        'the json scenes. Positions are the initial ' +\
+                        'positions of `A`.')
+    parser.add_argument('--table', type = str,
+                        help = 'Sweep table from `collision_sweep.py` ' +\
+                        'to plot instead of simulating scenes')
     args = parser.parse_args()
 
     out_path = CONFIG['PATHS', 'scenes']
@@ -90,17 +137,34 @@ def main():
 
     print('Saving profile to {0!s}'.format(profile_path))
 
-    pos_path = '{0:d}_valid_positions.json'.format(args.on_ramp)
-    pos_path = os.path.join(out_path, pos_path)
-    with open(pos_path, 'r') as f:
-        positions = json.load(f)
-
     durations = []
-    pos_suffix = '{0!s}_*/'.format(args.on_ramp) + '{0:d}_*.json'
-    for pos in positions:
-        scene_paths = glob.glob(os.path.join(out_path, pos_suffix.format(pos)))
-        t = list(map(get_collisions, scene_paths))
-        durations.append(t)
+    if not args.table is None:
+        positions, durations = profile_from_table(pd.read_csv(args.table))
+    elif args.catalog is None:
+        pos_path = '{0:d}_valid_positions.json'.format(args.on_ramp)
+        pos_path = os.path.join(out_path, pos_path)
+        with open(pos_path, 'r') as f:
+            positions = json.load(f)
+
+        pos_suffix = '{0!s}_*/'.format(args.on_ramp) + '{0:d}_*.json'
+        for pos in positions:
+            scene_paths = glob.glob(os.path.join(out_path, pos_suffix.format(pos)))
+            t = list(map(get_collisions, scene_paths))
+            durations.append(t)
+    else:
+        catalog = SceneCatalog(args.catalog)
+        positions = np.unique(catalog.query(object = 'A')['initial_pos'])
+        positions = positions.tolist()
+        for pos in positions:
+            idxs = catalog.query(object = 'A', initial_pos = pos)['scene']
+            t = [get_collisions(catalog[i]) for i in idxs]
+            durations.append(t)
+
+    n = len(positions)
+    positions, durations, dropped = drop_missing(positions, durations)
+    msg = 'Dropped {0:d} scenes with fewer than two collisions ' + \
+          '({1:d} positions left empty)'
+    print(msg.format(dropped, n - len(positions)))
 
     plot_profile(positions, durations, profile_path)
 
@@ -1,30 +1,116 @@
 #!/usr/bin/env python
-""" Evaluates a batch of blocks for stimuli generation.
+""" Profiles scene setup and short Markov simulations of ramp scenes.
+
+Two modes:
+
+* `dataset`: the MC physics of `physics.world` on a scene of the
+  `Exp1Dataset`
+* `mirror`: random scenes in the in-tree mirror (`ramp_physics`),
+  either rebuilt in a fresh simulation (`--fresh`) or placed in a
+  pooled client that keeps the static world (see
+  `ramp_physics.RampClient`)
 """
-from galileo_ramp import Exp1Dataset
-from physics.world import physics
+import time
+import argparse
+
+import numpy as np
 
+import ramp_physics
 
-def profile_scene(scene):
+
+def profile_mc_scene(scene, steps = 120):
+    """ Steps a scene with the MC physics one frame at a time.
+
+    Returns
+        The time spent on setup and on simulation
+    """
+    from physics.world import physics
+    t_0 = time.time()
     state = None
     client = physics.init_client()
     obj_ids = physics.init_world(scene, client)
-    for _ in range(120):
+    t_1 = time.time()
+    for _ in range(steps):
         physics.update_world(client, obj_ids, scene)
         state = physics.run_mc_trace(client, obj_ids,
                                      state = state)
-
+    t_2 = time.time()
     physics.clear_trace(client)
+    return t_1 - t_0, t_2 - t_1
 
-def get_scene(dataset):
-    scene,state, _ = dataset[0]
+def get_scene(dataset, idx = 0):
+    from galileo_ramp import Exp1Dataset
+    scene, _, _ = Exp1Dataset(dataset)[idx]
     return scene
 
+def profile_scene(world, params, steps = 120, k = 1):
+    """ Places a scene and steps it `k` frames at a time.
+
+    Returns
+        The time spent on setup and on simulation
+    """
+    t_0 = time.time()
+    if world is None:
+        client = ramp_physics.init_client()
+        objs = ramp_physics.ramp(client, **params)
+    else:
+        client = world.client
+        objs = world.load(**params)
+    t_1 = time.time()
+    sim = ramp_physics.MarkovSim(client, objs)
+    for _ in range(steps // k):
+        sim.step(k)
+        sim.read()
+    t_2 = time.time()
+    if world is None:
+        ramp_physics.pb.disconnect(physicsClientId = client)
+    return t_1 - t_0, t_2 - t_1
+
+def get_scenes(n, seed = 0):
+    rng = np.random.default_rng(seed)
+    return [{'density_ratio' : rng.uniform(0.25, 4.0),
+             'frictions' : tuple(rng.uniform(0.1, 0.5, size = 2)),
+             'positions' : (rng.uniform(0.1, 0.9), rng.uniform(1.1, 1.5))}
+            for _ in range(n)]
+
 
 def main():
-    dataset = Exp1Dataset("/databases/exp1.hdf5")
-    scene,state, _ = dataset[0]
-    mc_state = profile_scene(scene)
+    parser = argparse.ArgumentParser(
+        description = 'Profiles ramp scene setup and simulation',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--mode', type = str, default = 'dataset',
+                        choices = ['dataset', 'mirror'],
+                        help = 'Profile the MC physics on a dataset ' +\
+                        'scene or the in-tree mirror on random scenes')
+    parser.add_argument('--dataset', type = str,
+                        default = '/databases/exp1.hdf5',
+                        help = 'Dataset of the scene (dataset mode)')
+    parser.add_argument('--trial', type = int, default = 0,
+                        help = 'Trial of the scene (dataset mode)')
+    parser.add_argument('--scenes', type = int, default = 50,
+                        help = 'Number of random scenes (mirror mode)')
+    parser.add_argument('--steps', type = int, default = 120,
+                        help = 'Frames per scene')
+    parser.add_argument('--k', type = int, default = 1,
+                        help = 'Frames per Markov step (mirror mode)')
+    parser.add_argument('--fresh', action = 'store_true',
+                        help = 'Rebuild each scene in a new client ' +\
+                        '(mirror mode)')
+    args = parser.parse_args()
+
+    if args.mode == 'dataset':
+        scene = get_scene(args.dataset, args.trial)
+        times = profile_mc_scene(scene, args.steps)
+        msg = 'setup {0:.2f}ms; simulation {1:.2f}ms'
+        print(msg.format(*(1000 * np.array(times))))
+        return
+
+    world = None if args.fresh else ramp_physics.RampClient()
+    times = np.array([profile_scene(world, s, args.steps, args.k)
+                      for s in get_scenes(args.scenes)])
+    msg = 'setup {0:.2f}ms / scene; simulation {1:.2f}ms / scene'
+    print(msg.format(*(1000 * times.mean(axis = 0))))
 
 if __name__ == '__main__':
    main()
@@ -0,0 +1,519 @@
+""" Python mirror of the ramp scene built by `ramp` in `src/utils/scenes.jl`.
+
+Used by the validation scripts to simulate many ramp scenes directly
+in pybullet. Object `A` starts on the ramp and `B` on the table.
+"""
+import os
+import numpy as np
+import pybullet as pb
+
+from collisions import rising
+
+ramp_mesh = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', 'src', 'utils', 'ramp.obj')
+
+grey = [0.5, 0.5, 0.5, 1]
+base_dims = np.array([5, 1, 0.75]) # in meters
+table_dims = np.array([base_dims[0] + 0.2, base_dims[1] + 0.2, 0.1])
+obj_ramp_dims = np.array([0.15, 0.3, 0.075])
+obj_table_dims = np.array([0.2, 0.2, 0.1])
+obj_table_mass = 1.0
+
+fps = 60
+# physics steps per frame
+substeps = 4
+
+def init_client():
+    """ Connects a headless pybullet client """
+    client = pb.connect(pb.DIRECT)
+    reset_client(client)
+    return client
+
+def reset_client(client):
+    """ Removes all bodies and restores the simulation settings """
+    pb.resetSimulation(physicsClientId = client)
+    pb.setGravity(0, 0, -10, physicsClientId = client)
+    pb.setTimeStep(1.0 / (fps * substeps), physicsClientId = client)
+
+def _static_box(client, dims, pos, color, restitution = 0.9):
+    col = pb.createCollisionShape(pb.GEOM_BOX, halfExtents = dims / 2,
+                                  physicsClientId = client)
+    body = pb.createMultiBody(baseCollisionShapeIndex = col,
+                              basePosition = pos,
+                              physicsClientId = client)
+    pb.changeDynamics(body, -1, mass = 0., restitution = restitution,
+                      physicsClientId = client)
+    pb.changeVisualShape(body, -1, rgbaColor = color,
+                         physicsClientId = client)
+    return body
+
+def build_static(client, slope = 2/3, intersection = 0.,
+                 offset = (0, 0, 0), floor = True):
+    """ Adds the table, frame, ramp, floor and walls.
+
+    Arguments:
+        offset (tuple): Translation of the whole scene
+        floor (bool): Whether to add the (infinite) floor plane
+    Returns
+        A dictionary of body ids
+    """
+    shift = lambda p: np.add(p, offset)
+    ids = {}
+    ids['table_base'] = _static_box(client, base_dims,
+                                    shift([0, 0, -(base_dims[2] +
+                                                   table_dims[2])/2]),
+                                    grey)
+    ids['table'] = _static_box(client, table_dims,
+                               shift([0, 0, -table_dims[2]/2]),
+                               np.add(grey, 0.2))
+
+    # frame around the tabletop
+    frame_height = 0.25
+    frame_thickness = 0.05
+    frame_dims = [
+        [table_dims[0] + 2 * frame_thickness, frame_thickness, frame_height],
+        [table_dims[0] + 2 * frame_thickness, frame_thickness, frame_height],
+        [frame_thickness, table_dims[1], frame_height],
+        [frame_thickness, table_dims[1], frame_height]
+    ]
+    frame_positions = [
+        [0, table_dims[1] / 2 + frame_thickness / 2, 0],
+        [0, -table_dims[1] / 2 - frame_thickness / 2, 0],
+        [table_dims[0] / 2 + frame_thickness / 2, 0, 0],
+        [-table_dims[0] / 2 - frame_thickness / 2, 0, 0]
+    ]
+    ids['frame'] = [_static_box(client, np.array(d), shift(p), grey)
+                    for d, p in zip(frame_dims, frame_positions)]
+
+    # ramp
+    col = pb.createCollisionShape(pb.GEOM_MESH, fileName = ramp_mesh,
+                                  meshScale = [2, base_dims[1], slope * 2],
+                                  physicsClientId = client)
+    body = pb.createMultiBody(baseCollisionShapeIndex = col,
+                              basePosition = shift([-2 + intersection,
+                                                    -base_dims[1]/2, 0]),
+                              physicsClientId = client)
+    pb.changeDynamics(body, -1, mass = 0.0, restitution = 0.9,
+                      physicsClientId = client)
+    ids['ramp'] = body
+
+    # floor
+    if floor:
+        col = pb.createCollisionShape(pb.GEOM_PLANE,
+                                      physicsClientId = client)
+        body = pb.createMultiBody(baseCollisionShapeIndex = col,
+                                  basePosition = shift([0, 0,
+                                                        -base_dims[2]]),
+                                  physicsClientId = client)
+        pb.changeDynamics(body, -1, mass = 0.0, restitution = 0.9,
+                          physicsClientId = client)
+        ids['floor'] = body
+
+    # walls
+    wall_dims = [[0.1, 8.0, 5.0], [0.1, 8.0, 5.0], [8.0, 0.1, 5.0]]
+    wall_positions = [
+        [4.0, 0.0, 1.0],
+        [-4.0, 0.0, 1.0],
+        [0, 4, wall_dims[2][2]/2 - base_dims[2]]
+    ]
+    ids['walls'] = [_static_box(client, np.array(d), shift(p),
+                                np.add(grey, [0.2, 0.2, 0.2, 0]))
+                    for d, p in zip(wall_dims, wall_positions)]
+    return ids
+
+def _dynamic_shape(client, shape, dims):
+    if shape == 'Block':
+        return pb.createCollisionShape(pb.GEOM_BOX, halfExtents = dims / 2,
+                                       physicsClientId = client)
+    elif shape == 'Puck':
+        return pb.createCollisionShape(pb.GEOM_CYLINDER,
+                                       radius = dims[0] / 2,
+                                       height = dims[2],
+                                       physicsClientId = client)
+    raise ValueError('Not supported')
+
+def object_mass(density_ratio, shape = 'Block'):
+    """ Mass of `A` such that its density is `density_ratio` times `B`'s """
+    if shape == 'Block':
+        vol = np.prod(obj_ramp_dims)
+    else:
+        vol = np.pi * (obj_ramp_dims[0] / 2)**2 * obj_ramp_dims[2]
+    return density_ratio * obj_table_mass / np.prod(obj_table_dims) * vol
+
+def initial_poses(positions = (0.5, 1.5), slope = 2/3, intersection = 0.):
+    """ Returns the initial `(position, orientation)` of `A` and `B` """
+    theta = -np.arctan(slope)
+    # same (x, y, z, w) layout as `scenes.jl`
+    orientation = [np.cos(theta / 2), 0, np.sin(theta / 2), 0]
+    lift = obj_ramp_dims[2] / 2
+    position = [
+        -2 + 2 * positions[0] + intersection + lift * np.cos(theta),
+        0,
+        (2 - 2 * positions[0]) * slope - lift * np.sin(theta)
+    ]
+    table_position = [2.5 * (positions[1] - 1), 0, obj_table_dims[2] / 2]
+    return (position, orientation), (table_position, [0, 0, 0, 1])
+
+def _set_dynamics(client, a, b, density_ratio, frictions, shape):
+    pb.changeDynamics(a, -1, mass = object_mass(density_ratio, shape),
+                      restitution = 0.9, lateralFriction = frictions[0],
+                      physicsClientId = client)
+    pb.changeDynamics(b, -1, mass = obj_table_mass, restitution = 0.9,
+                      lateralFriction = frictions[1],
+                      physicsClientId = client)
+
+def add_objects(client, density_ratio = 1.0, frictions = (0.5, 0.5),
+                positions = (0.5, 1.5), shape = 'Block', slope = 2/3,
+                intersection = 0., offset = (0, 0, 0)):
+    """ Adds `A` on the ramp and `B` on the table.
+
+    Returns
+        The body ids of `A` and `B`
+    """
+    poses = initial_poses(positions, slope, intersection)
+    col = _dynamic_shape(client, shape, obj_ramp_dims)
+    a = pb.createMultiBody(baseCollisionShapeIndex = col,
+                           basePosition = np.add(poses[0][0], offset),
+                           baseOrientation = poses[0][1],
+                           physicsClientId = client)
+    col = _dynamic_shape(client, 'Block', obj_table_dims)
+    b = pb.createMultiBody(baseCollisionShapeIndex = col,
+                           basePosition = np.add(poses[1][0], offset),
+                           physicsClientId = client)
+    _set_dynamics(client, a, b, density_ratio, frictions, shape)
+    return a, b
+
+def ramp(client, **kwargs):
+    """ Builds a full ramp scene in a fresh simulation.
+
+    See `add_objects` for arguments.
+
+    Returns
+        The body ids of `A` and `B`
+    """
+    reset_client(client)
+    build_static(client, kwargs.get('slope', 2/3),
+                 kwargs.get('intersection', 0.))
+    return add_objects(client, **kwargs)
+
+class RampClient:
+
+    """
+    A pybullet client that keeps the static ramp world between scenes.
+
+    The table, frame, ramp mesh, floor, and walls are built once.
+    Each `load` only moves and reconfigures the dynamic objects
+    (recreating `A` if its shape changes) and snapshots the scene with
+    `saveState` so that `reset` can restart it.
+
+    Example::
+
+        world = RampClient()
+        for params in grid:
+            objs = world.load(**params)
+            state, _ = simulate(world.client, objs, 900)
+    """
+
+    def __init__(self, slope = 2/3, intersection = 0.):
+        self.client = init_client()
+        self.slope = slope
+        self.intersection = intersection
+        self.static = build_static(self.client, slope, intersection)
+        self.objs = None
+        self.shape = None
+        self._state = None
+
+    def load(self, density_ratio = 1.0, frictions = (0.5, 0.5),
+             positions = (0.5, 1.5), shape = 'Block'):
+        """ Places a scene's dynamic objects. See `add_objects`.
+
+        Returns
+            The body ids of `A` and `B`
+        """
+        if self.objs is None or shape != self.shape:
+            if not self.objs is None:
+                for o in self.objs:
+                    pb.removeBody(o, physicsClientId = self.client)
+            self.objs = add_objects(self.client, density_ratio, frictions,
+                                    positions, shape, self.slope,
+                                    self.intersection)
+            self.shape = shape
+        else:
+            poses = initial_poses(positions, self.slope, self.intersection)
+            for o, (p, q) in zip(self.objs, poses):
+                pb.resetBasePositionAndOrientation(o, p, q,
+                                                   physicsClientId = self.client)
+                pb.resetBaseVelocity(o, [0, 0, 0], [0, 0, 0],
+                                     physicsClientId = self.client)
+            _set_dynamics(self.client, *self.objs, density_ratio, frictions,
+                          shape)
+        if not self._state is None:
+            pb.removeState(self._state, physicsClientId = self.client)
+        self._state = pb.saveState(physicsClientId = self.client)
+        return self.objs
+
+    def reset(self):
+        """ Restores the scene placed by the last `load`.
+
+        Note that pybullet keeps contact caches across `restoreState`, so
+        a restored run is close to, but not bit identical with, a run in
+        a fresh client.
+        """
+        pb.restoreState(self._state, physicsClientId = self.client)
+
+    def close(self):
+        pb.disconnect(physicsClientId = self.client)
+
+class MarkovSim:
+
+    """
+    Steps a loaded scene while its state stays inside the client.
+
+    Snapshots are pybullet state handles (`saveState`), so a particle
+    can be rewound without pushing positions and velocities through
+    Python. State is only read with `read`. A snapshot costs several
+    frames of stepping, so take one only where a particle branches.
+
+    Example::
+
+        sim = MarkovSim(world.client, objs)
+        start = sim.snapshot()
+        sim.step(12)
+        pos = sim.read()['pos']
+        sim.restore(start)
+    """
+
+    fields = ['pos', 'orn', 'lin_vel', 'ang_vel']
+
+    def __init__(self, client, objs):
+        self.client = client
+        self.objs = list(objs)
+        self.t = 0
+
+    def step(self, k = 1):
+        """ Advances `k` frames """
+        for _ in range(k * substeps):
+            pb.stepSimulation(physicsClientId = self.client)
+        self.t += k
+
+    def snapshot(self):
+        """ Returns a handle to the current state """
+        return (pb.saveState(physicsClientId = self.client), self.t)
+
+    def restore(self, handle):
+        """ Returns to the state of a `snapshot` handle """
+        pb.restoreState(handle[0], physicsClientId = self.client)
+        self.t = handle[1]
+
+    def release(self, handle):
+        """ Frees a `snapshot` handle """
+        pb.removeState(handle[0], physicsClientId = self.client)
+
+    def read(self, fields = ('pos',)):
+        """ Returns the requested `NxK` state arrays """
+        out = {k : [] for k in fields}
+        for o in self.objs:
+            if 'pos' in out or 'orn' in out:
+                p, q = pb.getBasePositionAndOrientation(
+                    o, physicsClientId = self.client)
+                out.get('pos', []).append(p)
+                out.get('orn', []).append(q)
+            if 'lin_vel' in out or 'ang_vel' in out:
+                v, w = pb.getBaseVelocity(o, physicsClientId = self.client)
+                out.get('lin_vel', []).append(v)
+                out.get('ang_vel', []).append(w)
+        return {k : np.array(v) for k, v in out.items()}
+
+def _index(names, obj):
+    return obj if isinstance(obj, int) else names.index(obj)
+
+def first_contact(a = 'A', b = 'B'):
+    """ Event for the first frame where `a` touches `b` """
+    def test(state, t):
+        i = _index(state['names'], a)
+        j = _index(state['names'], b)
+        k = state['pairs'].index((min(i, j), max(i, j)))
+        return state['contacts'][t, k]
+    return ('contact_{0!s}_{1!s}'.format(a, b), test)
+
+def nth_contact(n):
+    """ Event for the `n`th collision (onset of contact) between objects """
+    def test(state, t):
+        collided = state['contacts'][:t + 1].any(axis = -1)
+        return rising(collided).sum() >= n
+    return ('contact_{0:d}'.format(n), test)
+
+def at_rest(tol = 1e-2, hold = 30):
+    """ Event for all objects moving slower than `tol` for `hold` frames """
+    def test(state, t):
+        if t < hold:
+            return False
+        window = slice(t - hold + 1, t + 1)
+        lin = np.linalg.norm(state['lin_vel'][window], axis = -1)
+        ang = np.linalg.norm(state['ang_vel'][window], axis = -1)
+        return np.all(lin < tol) and np.all(ang < tol)
+    return ('at_rest', test)
+
+def left_table(obj = 'A', margin = 0.1):
+    """ Event for `obj` falling `margin` below the tabletop """
+    def test(state, t):
+        i = _index(state['names'], obj)
+        return state['pos'][t, i, 2] < -margin
+    return ('left_{0!s}'.format(obj), test)
+
+def simulate(client, objs, frames, events = None, until = 'all'):
+    """ Steps the simulation and records the state of each object.
+
+    Events are `(name, test)` pairs (see `first_contact`, `nth_contact`,
+    `at_rest`, and `left_table`) where `test(state, t)` is true once
+    the event has occurred at frame `t`.
+
+    Arguments:
+        objs (list or dict): Body ids of the objects to track, optionally
+            by name
+        frames (int): Maximum number of frames
+        events (list, optional): Events to detect
+        until (str): Stop once 'all' or 'any' of the events occurred
+    Returns
+        A tuple `(state, timings)`. `state` has `TxNxK` arrays
+        (`pos`, `orn`, `lin_vel`, `ang_vel`) and a `TxP` array of
+        `contacts` between each pair of tracked objects, where
+        `T <= frames` is the number of simulated frames. `timings`
+        maps each event to its first frame or `None`.
+    """
+    if isinstance(objs, dict):
+        names = list(objs.keys())
+        objs = list(objs.values())
+    else:
+        names = list(range(len(objs)))
+    n = len(objs)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    state = {
+        'pos' : np.zeros((frames, n, 3)),
+        'orn' : np.zeros((frames, n, 4)),
+        'lin_vel' : np.zeros((frames, n, 3)),
+        'ang_vel' : np.zeros((frames, n, 3)),
+        'contacts' : np.zeros((frames, len(pairs)), dtype = bool),
+        'names' : names,
+        'pairs' : pairs
+    }
+    events = [] if events is None else events
+    timings = {name : None for name, _ in events}
+    resolved = all if until == 'all' else any
+    for t in range(frames):
+        # contacts may only last a substep
+        for _ in range(substeps):
+            pb.stepSimulation(physicsClientId = client)
+            for k, (i, j) in enumerate(pairs):
+                state['contacts'][t, k] |= len(pb.getContactPoints(
+                    bodyA = objs[i], bodyB = objs[j],
+                    physicsClientId = client)) > 0
+        for i, o in enumerate(objs):
+            p, q = pb.getBasePositionAndOrientation(o,
+                                                    physicsClientId = client)
+            v, w = pb.getBaseVelocity(o, physicsClientId = client)
+            state['pos'][t, i] = p
+            state['orn'][t, i] = q
+            state['lin_vel'][t, i] = v
+            state['ang_vel'][t, i] = w
+        for name, test in events:
+            if timings[name] is None and test(state, t):
+                timings[name] = t
+        if events and resolved(v is not None for v in timings.values()):
+            for k in ['pos', 'orn', 'lin_vel', 'ang_vel', 'contacts']:
+                state[k] = state[k][:t + 1]
+            break
+    return state, timings
+
+# isolated instances only collide within a group; groups repeat every
+# `group_bits` instances, which are far enough apart not to touch
+group_bits = 30
+
+def _bodies(ids):
+    for v in ids.values():
+        for o in (v if isinstance(v, list) else [v]):
+            yield o
+
+def ramp_batch(client, scenes, spacing = 10., isolate = True):
+    """ Builds independent ramp scenes side by side in one simulation.
+
+    Scenes are `spacing` meters apart along y and share one floor.
+    Their walls do not enclose them (there is no wall at -y), so
+    objects of different scenes only stay apart with `isolate`.
+
+    Arguments:
+        scenes (list): Keyword arguments of `add_objects` for each scene
+        isolate (bool): Restrict collisions to bodies of the same scene
+            (and the floor) with collision groups
+    Returns
+        A `Bx2` array of body ids and the `Bx3` offset of each scene
+    """
+    reset_client(client)
+    col = pb.createCollisionShape(pb.GEOM_PLANE, physicsClientId = client)
+    floor = pb.createMultiBody(baseCollisionShapeIndex = col,
+                               basePosition = [0, 0, -base_dims[2]],
+                               physicsClientId = client)
+    pb.changeDynamics(floor, -1, mass = 0.0, restitution = 0.9,
+                      physicsClientId = client)
+    if isolate:
+        everything = (1 << group_bits) - 1
+        pb.setCollisionFilterGroupMask(floor, -1, everything, everything,
+                                       physicsClientId = client)
+
+    objs = np.zeros((len(scenes), 2), dtype = int)
+    offsets = np.zeros((len(scenes), 3))
+    for i, scene in enumerate(scenes):
+        offsets[i, 1] = i * spacing
+        ids = build_static(client, scene.get('slope', 2/3),
+                           scene.get('intersection', 0.),
+                           offset = offsets[i], floor = False)
+        objs[i] = add_objects(client, offset = offsets[i], **scene)
+        if isolate:
+            group = 1 << (i % group_bits)
+            for o in list(_bodies(ids)) + list(objs[i]):
+                pb.setCollisionFilterGroupMask(int(o), -1, group, group,
+                                               physicsClientId = client)
+    return objs, offsets
+
+def simulate_batch(client, objs, offsets, frames, max_collisions = None):
+    """ Steps every scene of a `ramp_batch` together.
+
+    Arguments:
+        objs (np.ndarray): `BxN` body ids
+        offsets (np.ndarray): `Bx3` scene offsets
+        frames (int): Maximum number of frames
+        max_collisions (int, optional): Stop once every scene had this
+            many collisions (onsets of contact) between its objects
+    Returns
+        A dictionary of `BxTxNx3` positions (relative to each scene),
+        `BxTxNx4` orientations, and `BxTxP` contacts (see `simulate`)
+    """
+    n_scenes, n = objs.shape
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    pos = np.zeros((n_scenes, frames, n, 3))
+    orn = np.zeros((n_scenes, frames, n, 4))
+    contacts = np.zeros((n_scenes, frames, len(pairs)), dtype = bool)
+    ids = objs.tolist()
+    for t in range(frames):
+        for _ in range(substeps):
+            pb.stepSimulation(physicsClientId = client)
+            for b in range(n_scenes):
+                for k, (i, j) in enumerate(pairs):
+                    contacts[b, t, k] |= len(pb.getContactPoints(
+                        bodyA = ids[b][i], bodyB = ids[b][j],
+                        physicsClientId = client)) > 0
+        for b in range(n_scenes):
+            for i in range(n):
+                p, q = pb.getBasePositionAndOrientation(
+                    ids[b][i], physicsClientId = client)
+                pos[b, t, i] = p
+                orn[b, t, i] = q
+        if not max_collisions is None:
+            collided = contacts[:, :t + 1].any(axis = -1)
+            seen = rising(collided).sum(axis = -1)
+            if np.all(seen >= max_collisions):
+                frames = t + 1
+                break
+    pos -= offsets[:, None, None, :]
+    return {'pos' : pos[:, :frames], 'orn' : orn[:, :frames],
+            'contacts' : contacts[:, :frames]}
@@ -4,6 +4,7 @@
 """
 
 import os
+import sys
 import json
 import argparse
 import numpy as np
@@ -16,6 +17,12 @@ from matplotlib import cm
 from galileo_ramp.utils import config
 from galileo_ramp.world.simulation import exp2_physics
 
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+import trace_store
+
 CONFIG = config.Config()
 
 def simulate_scene(src):
@@ -125,11 +132,17 @@ def main():
     )
     parser.add_argument('src', type = str,
                         help = 'Path to json')
+    parser.add_argument('--positions', type = str,
+                        help = 'Binary trace or `_pos.npy` to compare. ' +\
+                        'Defaults to the `_pos.npy` next to the scene')
 
     args = parser.parse_args()
 
-    position_file = args.src.replace('.json', '_pos.npy')
-    trace = np.load(position_file)
+    position_file = args.positions
+    if position_file is None:
+        position_file = args.src.replace('.json', '_pos.npy')
+    # `compare_simulations` expects NxTx3 and modifies it in place
+    trace = np.array(trace_store.load_positions(position_file).swapaxes(0, 1))
     sim = simulate_scene(args.src)
     compare_simulations(trace, sim[0])
 
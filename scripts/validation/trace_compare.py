@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+""" Compares the legacy physics traces with current simulations.
+
+Every legacy `<name>_pos.npy` in a directory is paired with the current
+trace `<name>.trace` (see `trace_store`). Optionally, missing current
+traces are simulated from `<name>.json` first. Traces are stacked into
+`MxTxNx3` arrays (padded with `nan`) so that each measure is computed
+for the whole corpus at once:
+
+* `offsets`: translation between the initial positions
+* `frame_error`: per frame L2 error after removing the offsets
+* `collision_frames`: frame of closest approach between `A` and `B`
+* `best_lag`: time shift minimizing the mean error
+* `dtw`: dynamic time warping distance
+
+The result is a table with a row per trial and, optionally, a figure
+per trial.
+"""
+
+import os
+import sys
+import glob
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+import trace_store
+
+LEGACY_SUFFIX = '_pos.npy'
+
+def stack(traces):
+    """ Stacks `TxNx3` traces of varying length.
+
+    Returns
+        A `MxTxNx3` array padded with `nan` and the length of each trace
+    """
+    lengths = np.array([len(t) for t in traces])
+    n, k = traces[0].shape[1:]
+    out = np.full((len(traces), lengths.max(), n, k), np.nan)
+    for i, t in enumerate(traces):
+        out[i, :len(t)] = t
+    return out, lengths
+
+def legacy_names(src):
+    """ Names of the legacy traces in `src`, in order """
+    paths = glob.glob(os.path.join(src, '*' + LEGACY_SUFFIX))
+    return sorted(os.path.basename(p)[:-len(LEGACY_SUFFIX)] for p in paths)
+
+def load_corpus(src, current, names):
+    """ Loads paired legacy and current traces as stacked arrays """
+    legacy = [np.asarray(trace_store.load_positions(
+        os.path.join(src, n + LEGACY_SUFFIX))) for n in names]
+    sims = [np.asarray(trace_store.load_positions(
+        os.path.join(current, n + trace_store.EXT))) for n in names]
+    return stack(legacy), stack(sims)
+
+def simulate_missing(src, current, names):
+    """ Simulates and stores the current trace of each scene json """
+    from test_legacy_physics import simulate_scene
+    for n in names:
+        out = os.path.join(current, n + trace_store.EXT)
+        if not os.path.isfile(out):
+            s = simulate_scene(os.path.join(src, n + '.json'))
+            trace_store.write(out, {'pos' : s[0]})
+
+def offsets(legacy, current):
+    """ `MxNx3` translation from legacy to current initial positions """
+    return current[:, 0] - legacy[:, 0]
+
+def frame_error(legacy, current, offset = None):
+    """ `MxTxN` L2 error per frame after removing `offset`.
+
+    Frames past the end of either trace are `nan`.
+    """
+    if offset is None:
+        offset = offsets(legacy, current)
+    dur = min(legacy.shape[1], current.shape[1])
+    aligned = legacy[:, :dur] + offset[:, None]
+    return np.linalg.norm(aligned - current[:, :dur], axis = -1)
+
+def collision_frames(pos):
+    """ Frame of closest approach between the first two objects.
+
+    Arguments:
+        pos (np.ndarray): `MxTxNx3` positions
+    Returns
+        An `M` array of frame indices
+    """
+    dist = np.linalg.norm(pos[:, :, 1] - pos[:, :, 0], axis = -1)
+    return np.argmin(np.where(np.isnan(dist), np.inf, dist), axis = 1)
+
+def best_lag(legacy, current, max_lag = 30, offset = None):
+    """ Shift of `current` (in frames) that minimizes the mean error.
+
+    Lags without any frame where both (padded) traces are defined are
+    skipped.
+
+    Returns
+        The `M` best lags and the mean error at each (`nan` if no lag
+        overlaps)
+    """
+    if offset is None:
+        offset = offsets(legacy, current)
+    aligned = legacy + offset[:, None]
+    lags = np.arange(-max_lag, max_lag + 1)
+    errs = np.full((len(legacy), len(lags)), np.nan)
+    dur = min(aligned.shape[1], current.shape[1])
+    for i, lag in enumerate(lags):
+        if abs(lag) >= dur:
+            continue
+        if lag >= 0:
+            a, c = aligned[:, :dur - lag], current[:, lag:dur]
+        else:
+            a, c = aligned[:, -lag:dur], current[:, :dur + lag]
+        d = np.linalg.norm(a - c, axis = -1).reshape(len(a), -1)
+        overlap = np.sum(~np.isnan(d), axis = 1)
+        valid = overlap > 0
+        errs[valid, i] = np.nansum(d[valid], axis = 1) / overlap[valid]
+    best = np.nanargmin(np.where(np.isnan(errs), np.inf, errs), axis = 1)
+    return lags[best], errs[np.arange(len(errs)), best]
+
+def dtw(a, b, len_a, len_b):
+    """ Dynamic time warping distance between pairs of trajectories.
+
+    The recursion is evaluated one anti-diagonal at a time for all
+    pairs together.
+
+    Arguments:
+        a, b (np.ndarray): `MxTxK` trajectories (ie. flattened positions)
+        len_a, len_b (np.ndarray): `M` lengths of each trajectory
+    Returns
+        An `M` array of distances normalized by `len_a + len_b`
+    """
+    m, ta = a.shape[:2]
+    tb = b.shape[1]
+    a = np.nan_to_num(a)
+    b = np.nan_to_num(b)
+    rows = np.arange(m)
+    out = np.full(m, np.nan)
+    # cost of the last two diagonals, indexed by the row `i`
+    prev2 = np.full((m, ta), np.inf)
+    prev = np.full((m, ta), np.inf)
+    for d in range(ta + tb - 1):
+        i = np.arange(max(0, d - tb + 1), min(ta, d + 1))
+        j = d - i
+        cost = np.linalg.norm(a[:, i] - b[:, j], axis = -1)
+        cur = np.full((m, ta), np.inf)
+        if d == 0:
+            cur[:, 0] = cost[:, 0]
+        else:
+            # (i - 1, j), (i, j - 1), and (i - 1, j - 1)
+            up = np.where(i > 0, prev[:, np.maximum(i - 1, 0)], np.inf)
+            left = prev[:, i]
+            diag = np.where(i > 0, prev2[:, np.maximum(i - 1, 0)], np.inf)
+            cur[:, i] = cost + np.minimum(np.minimum(up, left), diag)
+        # record each pair once its end cell is reached
+        done = (len_a + len_b - 2) == d
+        if np.any(done):
+            out[done] = cur[rows[done], len_a[done] - 1]
+        prev2, prev = prev, cur
+    return out / (len_a + len_b)
+
+def summarize(names, legacy, len_l, current, len_c, max_lag = 30):
+    """ Returns a `pd.DataFrame` of measures with a row per trial """
+    off = offsets(legacy, current)
+    err = frame_error(legacy, current, off)
+    err = err.reshape(len(err), err.shape[1], -1)
+    col_l = collision_frames(legacy)
+    col_c = collision_frames(current)
+    lag, lag_err = best_lag(legacy, current, max_lag, off)
+    m = len(legacy)
+    dist = dtw((legacy + off[:, None]).reshape(m, legacy.shape[1], -1),
+               current.reshape(m, current.shape[1], -1), len_l, len_c)
+    return pd.DataFrame({
+        'trial' : names,
+        'frames_legacy' : len_l,
+        'frames_current' : len_c,
+        'offset' : np.linalg.norm(off, axis = -1).mean(axis = -1),
+        'mean_error' : np.nanmean(err, axis = (1, 2)),
+        'max_error' : np.nanmax(err, axis = (1, 2)),
+        'collision_legacy' : col_l,
+        'collision_current' : col_c,
+        'collision_delta' : col_c - col_l,
+        'lag' : lag,
+        'lag_error' : lag_err,
+        'dtw' : dist,
+    })
+
+def plot_trial(name, legacy, current, offset, error, out):
+    """ Plots the aligned x and z traces and the error of one trial """
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
+    aligned = legacy + offset
+    fig, axes = plt.subplots(nrows = 3, sharex = True, figsize = (8, 8))
+    for ax, k, label in zip(axes[:2], [0, 2], ['X', 'Z']):
+        for i in range(legacy.shape[1]):
+            ax.plot(aligned[:, i, k], label = 'legacy_{0:d}'.format(i))
+            ax.plot(current[:, i, k], '--',
+                    label = 'current_{0:d}'.format(i))
+        ax.set_ylabel(label)
+    axes[0].set_title('Aligned Physics Traces ({0!s})'.format(name))
+    axes[0].legend()
+    axes[2].plot(error)
+    axes[2].set_ylabel('L2')
+    axes[2].set_xlabel('Frame')
+    fig.savefig(os.path.join(out, '{0!s}.png'.format(name)))
+    plt.close(fig)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = 'Compares legacy traces with current simulations',
+        formatter_class = argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('src', type = str,
+                        help = 'Directory of `<name>_pos.npy` and scenes')
+    parser.add_argument('current', type = str,
+                        help = 'Directory of `<name>.trace` simulations')
+    parser.add_argument('--out', type = str, default = 'legacy_compare.csv',
+                        help = 'Path of the summary table')
+    parser.add_argument('--simulate', action = 'store_true',
+                        help = 'Simulate missing traces from `<name>.json`')
+    parser.add_argument('--max_lag', type = int, default = 30,
+                        help = 'Largest time shift (frames) to consider')
+    parser.add_argument('--figures', type = str,
+                        help = 'Directory to save a figure per trial')
+    args = parser.parse_args()
+
+    names = legacy_names(args.src)
+    os.makedirs(args.current, exist_ok = True)
+    if args.simulate:
+        simulate_missing(args.src, args.current, names)
+    (legacy, len_l), (current, len_c) = load_corpus(args.src, args.current,
+                                                    names)
+    df = summarize(names, legacy, len_l, current, len_c, args.max_lag)
+    df.to_csv(args.out, index = False)
+    print(df.describe().to_string())
+
+    if not args.figures is None:
+        os.makedirs(args.figures, exist_ok = True)
+        off = offsets(legacy, current)
+        err = frame_error(legacy, current, off)
+        for i, n in enumerate(names):
+            plot_trial(n, legacy[i, :len_l[i]], current[i, :len_c[i]],
+                       off[i], err[i, :min(len_l[i], len_c[i])],
+                       args.figures)
+
+if __name__ == '__main__':
+    main()
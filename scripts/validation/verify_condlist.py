@@ -4,24 +4,18 @@
 """
 
 import os
+import sys
 import json
 import argparse
-import numpy as np
 
-from galileo_ramp.utils import config, encoders
+from galileo_ramp.utils import config
 CONFIG = config.Config()
 
-def parse_file_str(fp):
-    """ Parses trial info from file path
-
-    Returns an integer representing the timing group for that trial.
-    """
-    base = os.path.basename(fp)
-    base = base[:-4] # remove ext
-    parts = base.split('_')
-    # the last digit notes the timing group
-    tg = parts[-1]
-    return tg
+# shared modules (see `scripts/repo_paths.py`)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import repo_paths
+from exp1_stimuli_from_scenes import report, timing_group, stimulus_path
 
 
 def main():
@@ -38,18 +32,10 @@ def main():
     with open(condlist_path, 'r') as f:
         condlist = json.load(f)
 
-    for idx, cond in enumerate(condlist):
-        # Each condition is a list of tuples (file path, [colors])
-        paths, _ = zip(*cond)
-        tgs = list(map(parse_file_str, paths))
-        # Obtain unique counts
-        groups, counts = np.unique(tgs, return_counts = True)
-        balance = dict(zip(groups, counts))
-        r_str = json.dumps(balance, indent = 4, sort_keys = True,
-                           cls = encoders.NpEncoder)
-        msg = 'Balance for condition {0:d}:\n\t{1!s}'.format(idx,
-                                                             r_str)
-        print(msg)
+    # Each condition is a list of file paths or (file path, [colors])
+    n_times = 1 + max(timing_group(stimulus_path(p))
+                      for cond in condlist for p in cond)
+    report(condlist, n_times)
 
 
 if __name__ == '__main__':
@@ -10,20 +10,49 @@ except:
     print('No `bpy` available')
 import json
 import time
+import hashlib
 import argparse
 
 import numpy as np
 
+# blender does not add the script's directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import trace_store
+
 # Flush stdout in case blender is complaining
 sys.stdout.flush()
 
+# Render settings traded off against speed.
+# `None` leaves the setting saved in the blend file untouched.
+quality_presets = {
+    'draft' : dict(engine = 'BLENDER_EEVEE',
+                   samples = 8,
+                   subdivisions = 3,
+                   vertices = 16,
+                   texture_size = 256,
+                   denoise = False),
+    'preview' : dict(engine = 'BLENDER_EEVEE',
+                     samples = 32,
+                     subdivisions = 5,
+                     vertices = 32,
+                     texture_size = 1024,
+                     denoise = False),
+    'final' : dict(engine = 'CYCLES',
+                   samples = 128,
+                   subdivisions = 7,
+                   vertices = 32,
+                   texture_size = None,
+                   denoise = True),
+}
+
 class RampScene:
 
     """
     Defines the ramp world in bpy.
     """
 
-    def __init__(self, scene, trace = None, theta = None):
+    def __init__(self, scene, trace = None, theta = None, bulk = False,
+                 quality = None):
         """ Initializes objects, physics, and camera
 
         :param scene: Describes the ramp, table, and balls.
@@ -32,16 +61,30 @@ class RampScene:
         :type trace: dict or None
         :param theta: Angle around the world to point the camera
         :type theta: float or None
+        :param bulk: Bake the whole trace into F-curves up front
+        :type bulk: bool
+        :param quality: One of `quality_presets`. Uses the settings
+                        in the blend file if `None`.
+        :type quality: str or None
         """
         # Initialize attributes
         self.trace = trace
         self.theta = theta
+        self.bulk = bulk
+        self.quality = quality
+        if quality is None:
+            self.settings = {}
+        else:
+            self.settings = quality_presets[quality]
 
         # Parse scene structure
         self.load_scene(scene)
         print('Loaded scene')
         sys.stdout.flush()
 
+        if self.bulk and not self.trace is None:
+            self.bake_trace()
+
     @property
     def trace(self):
         return self._trace
@@ -122,10 +165,12 @@ class RampScene:
         :param object_d: Describes the objects appearance and location.
         :type object_d: dict
         """
+        subdivisions = self.settings.get('subdivisions', 7)
+        vertices = self.settings.get('vertices', 32)
         if object_d['shape'] == 'Ball':
             bpy.ops.mesh.primitive_ico_sphere_add(location=object_d['position'],
                                                   enter_editmode=False,
-                                                  subdivisions=7,
+                                                  subdivisions=subdivisions,
                                                   radius = object_d['dims'][0])
         elif object_d['shape'] == 'Block':
             bpy.ops.mesh.primitive_cube_add(location=object_d['position'],
@@ -136,6 +181,7 @@ class RampScene:
         elif object_d['shape'] == 'Puck':
             bpy.ops.mesh.primitive_cylinder_add(
                 location=object_d['position'],
+                vertices=vertices,
                 enter_editmode=False,)
             ob = bpy.context.object
             self.scale_obj(ob, object_d['dims'])
@@ -188,6 +234,7 @@ class RampScene:
         self.rotate_obj(obj, [0, 0, np.pi])
         self.scale_obj(obj, [dx, y, dz*ratio])
         # self.set_appearance(obj, 'Ramp')
+        self.ramp = obj
 
     def load_scene(self, scene_dict):
         """ Configures the ramp, table, and balls
@@ -206,18 +253,201 @@ class RampScene:
         self.obj_names = obj_names
         for name, data in scene_dict['objects'].items():
             self.create_block(name, data)
+        self.static_d = {k : scene_dict[k] for k in ['ramp', 'table']}
+        self.scene_digest = digest(scene_dict)
+        self.hidden = []
+        self.compositor = None
+
+    def clear(self):
+        """ Removes the ramp and objects created by `load_scene`.
+
+        The rest of the blend file (table, walls, materials) is kept
+        so that another scene can be loaded in the same process.
+        """
+        self.clear_trace()
+        self.clear_plate()
+        objs = [bpy.data.objects[n] for n in self.obj_names]
+        objs.append(self.ramp)
+        for obj in objs:
+            mesh = obj.data
+            bpy.data.objects.remove(obj, do_unlink = True)
+            if mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+        bpy.context.view_layer.update()
 
     def set_rendering_params(self, resolution):
         """ Configures various settings for rendering such as resolution.
+
+        Engine, samples, denoising and texture size are taken from the
+        quality preset, if any.
+        """
+        scene = bpy.context.scene
+        scene.render.resolution_x = resolution[0]
+        scene.render.resolution_y = resolution[1]
+        scene.render.resolution_percentage = 100
+
+        engine = self.settings.get('engine')
+        if not engine is None:
+            scene.render.engine = engine
+        samples = self.settings.get('samples')
+        if not samples is None:
+            if scene.render.engine == 'CYCLES':
+                scene.cycles.samples = samples
+            else:
+                scene.eevee.taa_render_samples = samples
+        denoise = self.settings.get('denoise')
+        if not denoise is None and scene.render.engine == 'CYCLES':
+            scene.cycles.use_denoising = denoise
+        scale_textures(self.settings.get('texture_size'))
+
+    def static_objects(self):
+        """ Returns the renderable objects that never move.
+
+        Everything but the dynamic objects, camera, and lights.
+        """
+        dynamic = set(self.obj_names)
+        return [o for o in bpy.context.scene.objects
+                if not o.name in dynamic and not o.hide_render
+                and not o.type in ['CAMERA', 'LIGHT']]
+
+    def plate_key(self, resolution, theta):
+        """ Hash of the inputs that determine the background plate.
+        """
+        return digest(dict(static = self.static_d,
+                           resolution = list(resolution),
+                           theta = theta,
+                           quality = self.quality))
+
+    def frame_key(self, frame, resolution, cam):
+        """ Hash of the inputs that determine the image of a frame.
+
+        Covers the scene, the pose of each object at `frame`, and the
+        render settings.
+        """
+        key = hashlib.sha1(self.scene_digest.encode('utf-8'))
+        for k in ['pos', 'orn']:
+            pose = np.asarray(self.trace[k][frame], dtype = np.float64)
+            key.update(pose.tobytes())
+        settings = dict(resolution = list(map(int, resolution)),
+                        camera = float(cam),
+                        quality = self.quality,
+                        composite = len(self.hidden) > 0)
+        key.update(digest(settings).encode('utf-8'))
+        return key.hexdigest()
+
+    def render_plate(self, plate_dir, resolution, theta):
+        """ Renders the static geometry once with a depth pass.
+
+        The plate is a multilayer EXR shared by every scene with the
+        same ramp, table, resolution, and camera angle.
+
+        :param plate_dir: Directory holding cached plates
+        :type plate_dir: str
+        :returns: Path to the plate
+        """
+        os.makedirs(plate_dir, exist_ok = True)
+        key = self.plate_key(resolution, theta)
+        out = os.path.join(plate_dir, key + '.exr')
+        if os.path.isfile(out):
+            print('Using cached plate {0!s}'.format(out))
+            sys.stdout.flush()
+            return out
+
+        self.set_rendering_params(resolution)
+        render = bpy.context.scene.render
+        fmt = render.image_settings.file_format
+        dynamic = [bpy.data.objects[n] for n in self.obj_names]
+        for obj in dynamic:
+            obj.hide_render = True
+        use_pass_z = bpy.context.view_layer.use_pass_z
+        bpy.context.view_layer.use_pass_z = True
+        render.image_settings.file_format = 'OPEN_EXR_MULTILAYER'
+        # write to a temporary file as other workers may share `plate_dir`
+        tmp = os.path.join(plate_dir, '{0!s}_{1:d}'.format(key, os.getpid()))
+        render.filepath = tmp
+        t_0 = time.time()
+        with Suppressor():
+            bpy.ops.render.render(write_still=True)
+        os.replace(tmp + '.exr', out)
+        render.image_settings.file_format = fmt
+        bpy.context.view_layer.use_pass_z = use_pass_z
+        for obj in dynamic:
+            obj.hide_render = False
+        print('Rendering plate {} took {}s'.format(out, time.time() - t_0))
+        sys.stdout.flush()
+        return out
+
+    def use_plate(self, plate):
+        """ Composites the dynamic objects over a cached plate.
+
+        Static objects are hidden from the render and the dynamic
+        layer is z-combined with the plate's image and depth, so
+        occlusion by the ramp or table is preserved. Shadows cast
+        by the dynamic objects onto static geometry are not.
+
+        :param plate: Path returned by `render_plate`
+        :type plate: str
+        """
+        scene = bpy.context.scene
+        layer = bpy.context.view_layer
+        # the blend file's settings, restored by `clear_plate`
+        self.compositor = dict(use_nodes = scene.use_nodes,
+                               film_transparent =
+                               scene.render.film_transparent,
+                               use_pass_z = layer.use_pass_z,
+                               added = [], links = [])
+        self.hidden = self.static_objects()
+        for obj in self.hidden:
+            obj.hide_render = True
+        layer.use_pass_z = True
+        scene.render.film_transparent = True
+
+        scene.use_nodes = True
+        tree = scene.node_tree
+        added = self.compositor['added']
+        composite = composite_node(tree)
+        if composite is None:
+            composite = tree.nodes.new('CompositorNodeComposite')
+            added.append(composite.name)
+        else:
+            # reroute the existing output, keeping the rest of the tree
+            for link in list(composite.inputs[0].links):
+                self.compositor['links'].append(
+                    (link.from_node.name, link.from_socket.identifier))
+                tree.links.remove(link)
+        layers = tree.nodes.new('CompositorNodeRLayers')
+        image = tree.nodes.new('CompositorNodeImage')
+        image.image = bpy.data.images.load(plate, check_existing = True)
+        combine = tree.nodes.new('CompositorNodeZcombine')
+        combine.use_alpha = True
+        added.extend([layers.name, image.name, combine.name])
+        tree.links.new(layers.outputs['Image'], combine.inputs[0])
+        tree.links.new(depth_socket(layers), combine.inputs[1])
+        tree.links.new(image.outputs['Image'], combine.inputs[2])
+        tree.links.new(depth_socket(image), combine.inputs[3])
+        tree.links.new(combine.outputs[0], composite.inputs[0])
+
+    def clear_plate(self):
+        """ Undoes `use_plate`, restoring the blend file's compositor.
         """
-        # bpy.context.scene.render.engine = 'CYCLES'
-        # bpy.context.scene.render.engine = 'BLENDER_EEVEE'
-        bpy.context.scene.render.resolution_x = resolution[0]
-        bpy.context.scene.render.resolution_y = resolution[1]
-        bpy.context.scene.render.resolution_percentage = 100
-        # bpy.context.scene.cycles.samples = 128
-        # bpy.context.scene.render.tile_x = 16
-        # bpy.context.scene.render.tile_y = 16
+        for obj in self.hidden:
+            obj.hide_render = False
+        self.hidden = []
+        if self.compositor is None:
+            return
+        scene = bpy.context.scene
+        tree = scene.node_tree
+        for name in self.compositor['added']:
+            tree.nodes.remove(tree.nodes[name])
+        composite = composite_node(tree)
+        for name, identifier in self.compositor['links']:
+            socket = next(o for o in tree.nodes[name].outputs
+                          if o.identifier == identifier)
+            tree.links.new(socket, composite.inputs[0])
+        scene.use_nodes = self.compositor['use_nodes']
+        scene.render.film_transparent = self.compositor['film_transparent']
+        bpy.context.view_layer.use_pass_z = self.compositor['use_pass_z']
+        self.compositor = None
 
     def set_camera(self, rot):
         """ Moves the camera along a circular path.
@@ -241,8 +471,8 @@ class RampScene:
     def _frame_set(self,frame):
         """ Helper to `frame_set`.
         """
-        positions = np.array(self.trace['pos'][frame])
-        rotations = np.array(self.trace['orn'][frame])
+        positions = np.asarray(self.trace['pos'][frame])
+        rotations = np.asarray(self.trace['orn'][frame])
         n_balls = len(positions)
         for ball_i in range(n_balls):
             obj_name = self.obj_names[ball_i]
@@ -252,6 +482,85 @@ class RampScene:
             ball.keyframe_insert(data_path='location', index = -1)
             ball.keyframe_insert(data_path='rotation_quaternion', index = -1)
 
+    def _bake_channel(self, action, data_path, frames, values):
+        """ Writes one keyframe per frame for each component of `data_path`.
+
+        :param frames: Frame numbers of shape `T`
+        :param values: Channel values of shape `TxK`
+        """
+        co = np.empty((len(frames), 2), dtype = np.float32)
+        co[:, 0] = frames
+        for k in range(values.shape[-1]):
+            fcurve = action.fcurves.new(data_path = data_path, index = k,
+                                        action_group = 'Trace')
+            fcurve.keyframe_points.add(len(frames))
+            co[:, 1] = values[:, k]
+            fcurve.keyframe_points.foreach_set('co', co.ravel())
+            fcurve.update()
+
+    def bake_trace(self):
+        """ Writes the entire trace as keyframes in a single pass.
+
+        Unlike `_frame_set`, objects are never selected or moved.
+        The `TxNxK` position and orientation arrays are copied directly
+        into each object's F-curves and the view layer is updated once.
+        """
+        positions = np.asarray(self.trace['pos'], dtype = np.float32)
+        rotations = np.asarray(self.trace['orn'], dtype = np.float32)
+        # xyzw -> wxyz (see `rotate_obj`)
+        rotations = np.roll(rotations, 1, axis = -1)
+        frames = np.arange(positions.shape[0], dtype = np.float32)
+        for ball_i in range(positions.shape[1]):
+            ball = bpy.data.objects[self.obj_names[ball_i]]
+            ball.rotation_mode = 'QUATERNION'
+            ball.animation_data_clear()
+            action = bpy.data.actions.new('{0!s}_Trace'.format(ball.name))
+            ball.animation_data_create().action = action
+            self._bake_channel(action, 'location', frames,
+                               positions[:, ball_i])
+            self._bake_channel(action, 'rotation_quaternion', frames,
+                               rotations[:, ball_i])
+        bpy.context.view_layer.update()
+
+    def clear_trace(self):
+        """ Removes all keyframes from the dynamic objects.
+        """
+        for name in self.obj_names:
+            ball = bpy.data.objects[name]
+            action = None
+            if not ball.animation_data is None:
+                action = ball.animation_data.action
+            ball.animation_data_clear()
+            if not action is None:
+                bpy.data.actions.remove(action)
+        bpy.context.view_layer.update()
+
+    def profile_trace(self):
+        """ Times per-frame keyframing against `bake_trace`.
+
+        Both paths key every frame of the current trace. The scene
+        is left in the baked state.
+
+        :returns: A dictionary of durations in seconds.
+        """
+        n_frames = len(self.trace['pos'])
+        self.clear_trace()
+        t_0 = time.time()
+        for frame in range(n_frames):
+            bpy.context.scene.frame_set(frame)
+            self._frame_set(frame)
+        bpy.context.view_layer.update()
+        per_frame = time.time() - t_0
+
+        self.clear_trace()
+        t_0 = time.time()
+        self.bake_trace()
+        bulk = time.time() - t_0
+        self.bulk = True
+        return {'frames' : n_frames,
+                'per_frame' : per_frame,
+                'bulk' : bulk}
+
 
     def frame_set(self, frame, rot):
         """ Updates the scene to the given frame.
@@ -267,17 +576,21 @@ class RampScene:
         n_sims = len(self.trace)
         print('Setting frame {0:d}'.format(frame))
         sys.stdout.flush()
-        self._frame_set(frame)
+        # keyframes already exist if the trace was baked
+        if not self.bulk:
+            self._frame_set(frame)
         bpy.context.view_layer.update()
         print('Setting frame {0:d} ...done'.format(frame))
         sys.stdout.flush()
 
 
     def render(self, output_name, frames,
-               resolution = (256, 256), camera_rot = None):
+               resolution = (256, 256), camera_rot = None,
+               indices = None):
         """ Renders a scene.
 
-        Skips over existing frames
+        Skips over frames that exist and whose key (see `frame_key`)
+        matches the one recorded in `manifest.jsonl`.
 
         :param output_name: Path to save frames
         :type output_name: str
@@ -287,6 +600,9 @@ class RampScene:
         :type resolution: tuple(int, int)
         :param camera_rot: Rotation for camera.
         :type camera_rot: float
+        :param indices: Output image index for each frame.
+                        Defaults to `0...len(frames)-1`.
+        :type indices: list or None
 
         """
         if not os.path.isdir(output_name):
@@ -295,9 +611,14 @@ class RampScene:
 
         if camera_rot is None:
             camera_rot = np.zeros(len(frames))
-        for i, (frame, cam) in enumerate(zip(frames, camera_rot)):
+        if indices is None:
+            indices = range(len(frames))
+        manifest_path = os.path.join(output_name, 'manifest.jsonl')
+        manifest = read_manifest(manifest_path)
+        for i, frame, cam in zip(indices, frames, camera_rot):
             out = os.path.join(output_name, '{0:d}'.format(i))
-            if os.path.isfile(out + '.png'):
+            key = self.frame_key(frame, resolution, cam)
+            if os.path.isfile(out + '.png') and manifest.get(i) == key:
                 msg = 'Frame {} already rendered at {}'
                 msg = msg.format(i, out)
                 print(msg)
@@ -311,6 +632,7 @@ class RampScene:
             with Suppressor():
                 bpy.ops.render.render(write_still=True)
             dur = time.time() - t_0
+            record_frame(manifest_path, i, key)
             print('Rendering frame {} at {} took {}s'.format(i, out, dur))
             sys.stdout.flush()
 
@@ -323,6 +645,95 @@ class RampScene:
             self.frame_set(i, self.theta)
         bpy.ops.wm.save_as_mainfile(filepath=out)
 
+# original size of each downscaled material texture, by image name
+_scaled_textures = {}
+
+def material_images():
+    """ Images used by image texture nodes of materials.
+
+    Render outputs and compositor images (ie. the background plate)
+    are not included.
+    """
+    images = {}
+    for mat in bpy.data.materials:
+        if not mat.use_nodes or mat.node_tree is None:
+            continue
+        for node in mat.node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and not node.image is None:
+                images[node.image.name] = node.image
+    return images
+
+def scale_textures(size):
+    """ Downscales material textures to at most `size` pixels.
+
+    `image.scale` is destructive, so the originals are reloaded
+    before scaling to a different size or when `size` is `None`.
+    """
+    for name, image in material_images().items():
+        orig = _scaled_textures.get(name)
+        if orig is None:
+            orig = tuple(image.size)
+        target = orig
+        if not size is None and max(orig) > size:
+            ratio = size / max(orig)
+            target = (max(1, int(orig[0] * ratio)),
+                      max(1, int(orig[1] * ratio)))
+        if tuple(image.size) == target:
+            continue
+        if name in _scaled_textures:
+            image.reload()
+            del _scaled_textures[name]
+        if target != orig:
+            image.scale(*target)
+            _scaled_textures[name] = orig
+
+def digest(obj):
+    """ Hex digest of a json serializable object.
+
+    Numpy values are converted to lists.
+    """
+    obj = json.dumps(obj, sort_keys = True,
+                     default = lambda x: np.asarray(x).tolist())
+    return hashlib.sha1(obj.encode('utf-8')).hexdigest()
+
+def read_manifest(path):
+    """ Returns the latest key recorded for each rendered image.
+
+    The manifest is append-only (one json object per line) so that
+    several frame shards can record into the same trial directory.
+    """
+    manifest = {}
+    if not os.path.isfile(path):
+        return manifest
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # interrupted write
+                continue
+            manifest[entry['index']] = entry['key']
+    return manifest
+
+def record_frame(path, index, key):
+    """ Appends a rendered image and its key to the manifest.
+    """
+    with open(path, 'a') as f:
+        f.write(json.dumps({'index' : int(index), 'key' : key}) + '\n')
+
+def composite_node(tree):
+    """ The first composite output of a compositor tree, if any """
+    return next((n for n in tree.nodes if n.type == 'COMPOSITE'), None)
+
+def depth_socket(node):
+    """ Returns the depth output of a compositor node.
+
+    The pass was renamed from `Z` to `Depth` in blender 2.9.
+    """
+    if 'Depth' in node.outputs:
+        return node.outputs['Depth']
+    return node.outputs['Z']
+
 # From https://stackoverflow.com/questions/11130156/suppress-stdout-stderr-print-from-python-functions
 class Suppressor(object):
 
@@ -361,14 +772,16 @@ def parser(args):
     p.add_argument('--scene', type =load_data,
                    help = 'Tower json describing the scene.')
     p.add_argument('--trace', type = load_trace,
-                   help = 'Trace json for physics.')
+                   help = 'Trace json or binary trace for physics.')
     p.add_argument('--out', type = str,
                    help = 'Path to save rendering')
     p.add_argument('--save_world', action = 'store_true',
                    help = 'Save the resulting blend scene')
     p.add_argument('--render_mode', type = str, default = 'default',
-                   choices = ['default', 'none'],
+                   choices = ['default', 'composite', 'none'],
                    help = 'mode to render')
+    p.add_argument('--plate_dir', type = str,
+                   help = 'Cache for static plates (composite mode)')
     p.add_argument('--resolution', type = int, nargs = 2,
                    default = (256,256),  help = 'Render resolution')
     p.add_argument('--theta', type = float, default = 0,
@@ -377,11 +790,30 @@ def parser(args):
                    help = 'Use CUDA rendering')
     p.add_argument('--frames', type = int, nargs = '+',
                    help = 'Specific frames to render')
+    p.add_argument('--bulk_trace', action = 'store_true',
+                   help = 'Bake the full trace into F-curves before rendering')
+    p.add_argument('--profile_trace', action = 'store_true',
+                   help = 'Report per-frame vs bulk trace loading times')
+    p.add_argument('--serve', action = 'store_true',
+                   help = 'Render JSON-lines jobs from stdin')
+    p.add_argument('--shard', type = int, nargs = 2,
+                   help = 'Only render block K of N of the frames')
+    p.add_argument('--threads', type = int,
+                   help = 'Number of render threads')
+    p.add_argument('--quality', type = str,
+                   choices = list(quality_presets.keys()),
+                   help = 'Render quality preset')
     return p.parse_args(args)
 
 
 def load_trace(path):
-    """Helper that loads trace file"""
+    """Helper that loads trace file
+
+    Binary traces (see `trace_store`) are memory mapped, otherwise
+    the file is parsed as json.
+    """
+    if trace_store.is_trace_store(path):
+        return trace_store.load(path)
     with open(path, 'r') as f:
         str = f.read()
         traces = json.loads(str)
@@ -393,39 +825,165 @@ def load_data(path):
         data = json.load(f)
     return data['scene']
 
+def shard_indices(n_frames, shard):
+    """ Returns the contiguous block of `range(n_frames)` for a shard.
+
+    :param shard: `(k, n)` for the `k`th out of `n` shards.
+    :type shard: tuple(int, int)
+    """
+    k, n = shard
+    return np.array_split(np.arange(n_frames), n)[k]
+
+def render_scene(scene, trace, out, frames = None, theta = 0,
+                 resolution = (256, 256), render_mode = 'default',
+                 save_world = False, shard = None, plate_dir = None):
+    """ Renders (and optionally saves) a loaded `RampScene`.
+
+    :param scene: The scene to render
+    :type scene: RampScene
+    :param trace: The physics trace loaded into `scene`
+    :type trace: dict
+    :param out: Directory where `render/<i>.png` are written
+    :type out: str
+    :param frames: Frames to render. Defaults to the entire trace.
+    :type frames: list or None
+    :param shard: Only render the `k`th of `n` blocks of `frames`.
+                  Images keep their index in the full frame list.
+    :type shard: tuple(int, int) or None
+    :param plate_dir: Where background plates are cached for
+                      `render_mode='composite'`. Defaults to the parent
+                      of `out` so that plates are shared across trials.
+    :type plate_dir: str or None
+    """
+    path = os.path.join(out, 'render')
+    os.makedirs(path, exist_ok = True)
+
+    if frames is None:
+        frames = np.arange(len(trace['pos']))
+    indices = np.arange(len(frames))
+    if not shard is None:
+        indices = shard_indices(len(frames), shard)
+        frames = np.asarray(frames)[indices]
+    n_frames = len(frames)
+
+    if render_mode == 'composite':
+        if plate_dir is None:
+            plate_dir = os.path.join(os.path.dirname(os.path.abspath(out)),
+                                     'plates')
+        plate = scene.render_plate(plate_dir, resolution, theta)
+        scene.use_plate(plate)
+
+    if render_mode in ['default', 'composite']:
+        scene.render(path, frames,
+                     camera_rot = np.repeat(theta, n_frames),
+                     resolution = resolution,
+                     indices = indices)
+
+    if save_world:
+        path = os.path.join(out, 'world.blend')
+        n_frames = len(trace['pos'])
+        scene.save(path, n_frames)
+
+
+def serve(args):
+    """ Renders jobs read from stdin, one JSON object per line.
+
+    The blend file (and its materials) is only loaded once. Each job
+    must define `scene`, `trace`, and `out` where `scene` and `trace`
+    are either paths or the already parsed objects. `frames`,
+    `theta`, `resolution`, `render_mode`, `shard`, `plate_dir` and
+    `quality` are optional and default to the command line arguments.
+
+    After each job the scene objects are removed and a line
+    `JOB <status> <json>` is written to stdout.
+    """
+    print('Serving render jobs from stdin')
+    sys.stdout.flush()
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        t_0 = time.time()
+        status = 'done'
+        scene = None
+        out = None
+        try:
+            job = json.loads(line)
+            out = job['out']
+            scene_d = job['scene']
+            if isinstance(scene_d, str):
+                scene_d = load_data(scene_d)
+            trace = job['trace']
+            if isinstance(trace, str):
+                trace = load_trace(trace)
+            theta = job.get('theta', args.theta)
+            scene = RampScene(scene_d, trace, theta = theta,
+                              bulk = args.bulk_trace,
+                              quality = job.get('quality', args.quality))
+            render_scene(scene, trace, out,
+                         frames = job.get('frames', args.frames),
+                         theta = theta,
+                         resolution = job.get('resolution', args.resolution),
+                         render_mode = job.get('render_mode',
+                                               args.render_mode),
+                         save_world = job.get('save_world', args.save_world),
+                         shard = job.get('shard', args.shard),
+                         plate_dir = job.get('plate_dir', args.plate_dir))
+        except Exception as e:
+            status = 'failed'
+            print('Job {0!s} failed: {1!r}'.format(out, e))
+        finally:
+            if not scene is None:
+                scene.clear()
+        report = {'out' : out, 'time' : time.time() - t_0}
+        print('JOB {0!s} {1!s}'.format(status, json.dumps(report)))
+        sys.stdout.flush()
+
+
 def main():
     argv = sys.argv
     if '--' in sys.argv:
         argv = sys.argv[sys.argv.index('--') + 1:]
     args = parser(argv)
 
-    scene = RampScene(args.scene, args.trace,
-                      theta = args.theta)
-
     if args.gpu:
         print('Using gpu')
         bpy.context.scene.cycles.device = 'GPU'
 
-    path = os.path.join(args.out, 'render')
-    if not os.path.isdir(path):
-        os.mkdir(path)
+    if not args.threads is None:
+        bpy.context.scene.render.threads_mode = 'FIXED'
+        bpy.context.scene.render.threads = args.threads
 
-    if args.frames is None:
-        n_frames = len(args.trace['pos'])
-        frames = np.arange(n_frames)
-    else:
-        n_frames = len(args.frames)
-        frames = args.frames
+    if args.serve:
+        serve(args)
+        return
 
-    if args.render_mode == 'default':
-        scene.render(path, frames,
-                     camera_rot = np.repeat(args.theta, n_frames),
-                     resolution = args.resolution,)
+    scene = RampScene(args.scene, args.trace,
+                      theta = args.theta,
+                      bulk = args.bulk_trace,
+                      quality = args.quality)
+
+    if args.profile_trace:
+        report = scene.profile_trace()
+        msg = 'Trace loading ({0:d} frames)\n' + \
+              '\tper-frame: {1:.3f}s ({2:.2f}ms/frame)\n' + \
+              '\tbulk: {3:.3f}s ({4:.2f}ms/frame)\n' + \
+              '\tspeedup: {5:.1f}x'
+        n = report['frames']
+        print(msg.format(n,
+                         report['per_frame'], 1000 * report['per_frame'] / n,
+                         report['bulk'], 1000 * report['bulk'] / n,
+                         report['per_frame'] / max(report['bulk'], 1e-9)))
+        sys.stdout.flush()
 
-    if args.save_world:
-        path = os.path.join(args.out, 'world.blend')
-        n_frames = len(args.trace['pos'])
-        scene.save(path, n_frames)
+    render_scene(scene, args.trace, args.out,
+                 frames = args.frames,
+                 theta = args.theta,
+                 resolution = args.resolution,
+                 render_mode = args.render_mode,
+                 save_world = args.save_world,
+                 shard = args.shard,
+                 plate_dir = args.plate_dir)
 
 if __name__ == '__main__':
     main()
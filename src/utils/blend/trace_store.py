@@ -0,0 +1,114 @@
+""" Binary storage for physics traces.
+
+A trace file holds fixed-dtype `TxNxK` arrays (`pos`, `orn`,
+`lin_vel`, `ang_vel`) after a small json header, so that traces are
+opened with `np.memmap` instead of being parsed.
+
+Layout::
+
+    b'GTRACE01' | uint32 header length | json header | padding | arrays
+
+The header maps each field to its shape and byte offset from the
+first array.
+"""
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'GTRACE01'
+EXT = '.trace'
+FIELDS = ['pos', 'orn', 'lin_vel', 'ang_vel']
+# arrays start on a multiple of `ALIGN` bytes
+ALIGN = 64
+
+def aligned(n):
+    """ Rounds `n` up to a multiple of `ALIGN` """
+    return -(-n // ALIGN) * ALIGN
+
+def is_trace_store(path):
+    """ Returns `True` if `path` is a binary trace """
+    if not isinstance(path, str):
+        return False
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def write(path, trace, dtype = '<f8'):
+    """ Writes a trace.
+
+    :param path: Output path
+    :param trace: A dictionary of `TxNxK` arrays. Fields
+                  not in `FIELDS` are ignored.
+    :param dtype: Storage dtype for all fields
+    """
+    arrays = {k : np.ascontiguousarray(trace[k], dtype = dtype)
+              for k in FIELDS if k in trace}
+    header = {'dtype' : np.dtype(dtype).str, 'fields' : {}}
+    offset = 0
+    for k, a in arrays.items():
+        header['fields'][k] = {'offset' : offset, 'shape' : list(a.shape)}
+        offset += aligned(a.nbytes)
+    blob = json.dumps(header).encode('utf-8')
+    start = aligned(len(MAGIC) + 4 + len(blob))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(blob)))
+        f.write(blob)
+        for k, a in arrays.items():
+            f.seek(start + header['fields'][k]['offset'])
+            f.write(a.tobytes())
+
+def read_header(path):
+    """ Returns the json header of a binary trace.
+
+    The header also records `start`, the offset of the first array.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{0!s} is not a trace file'.format(path))
+        (n,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(n).decode('utf-8'))
+    header['start'] = aligned(len(MAGIC) + 4 + n)
+    return header
+
+def load(path):
+    """ Opens a binary trace without copying.
+
+    :returns: A dictionary of read-only `np.memmap` arrays
+    """
+    header = read_header(path)
+    trace = {}
+    for k, field in header['fields'].items():
+        trace[k] = np.memmap(path, dtype = header['dtype'], mode = 'r',
+                             offset = header['start'] + field['offset'],
+                             shape = tuple(field['shape']))
+    return trace
+
+def load_positions(path):
+    """ Returns `TxNx3` positions from a binary trace or legacy `_pos.npy`.
+
+    Legacy position files are stored as `NxTx3`.
+    """
+    if is_trace_store(path):
+        return load(path)['pos']
+    return np.transpose(np.load(path, mmap_mode = 'r'), (1, 0, 2))
+
+def main():
+    """ Converts a json trace to a binary trace """
+    import argparse
+    p = argparse.ArgumentParser(description = 'Converts a json trace')
+    p.add_argument('src', type = str, help = 'Trace json')
+    p.add_argument('out', type = str, help = 'Binary trace path')
+    p.add_argument('--dtype', type = str, default = '<f8',
+                   help = 'Storage dtype')
+    args = p.parse_args()
+    with open(args.src, 'r') as f:
+        trace = json.load(f)
+    write(args.out, trace, dtype = args.dtype)
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,15 @@
-export ramp
+export ramp,
+    RampWorld,
+    ramp!,
+    reset_ramp!
 
 # TODO: support the interface defined in the docstring below
 """
     ramp(mass_ratio::Float64, obj_frictions::NTuple{2, Float64},
          obj_positions::NTuple{2}; slope, ramp_intersection)
+
+Builds a new ramp world in a fresh pybullet client.
+Use a `RampWorld` with `ramp!` to reuse the static world across scenes.
 """
 function ramp(
     mass_ratio::Float64,
@@ -12,16 +18,58 @@ function ramp(
     slope::Float64=2/3,
     tableRampIntersection::Float64=0.
     )
+    world = RampWorld(slope, tableRampIntersection)
+    ramp!(world, mass_ratio, obj_frictions, obj_positions)
+end
+
+"""
+A pybullet client holding the static parts of the ramp scene
+(table, frame, ramp, floor and walls).
+
+The two dynamic objects are created once and then moved and
+reconfigured by `ramp!` for each scene.
+
+$(TYPEDEF)
+
+---
+
+$(TYPEDFIELDS)
+"""
+mutable struct RampWorld
+    client::Int64
+    slope::Float64
+    tableRampIntersection::Float64
+    "Object on the ramp (-1 until the first `ramp!`)"
+    a::Int64
+    "Object on the table (-1 until the first `ramp!`)"
+    b::Int64
+    "Snapshot of the current scene at rest (-1 if none)"
+    state::Int64
+end
+
+"""
+$(TYPEDSIGNATURES)
+
+Connects a pybullet client and builds the static ramp world.
+"""
+function RampWorld(slope::Float64=2/3, tableRampIntersection::Float64=0.)
     # for debugging
     #client = @pycall pb.connect(pb.GUI)::Int64
     #pb.resetDebugVisualizerCamera(4.5, 0, -40, [0.0, 0.0, 0.0]; physicsClientId=client)
     client = @pycall pb.connect(pb.DIRECT)::Int64
     pb.setGravity(0,0,-10; physicsClientId = client)
+    static_ramp!(client, slope, tableRampIntersection)
+    RampWorld(client, slope, tableRampIntersection, -1, -1, -1)
+end
 
+const base_dims = [5, 1, 0.75] # in meters
+const obj_ramp_dims = [0.15, 0.3, 0.075]
+const obj_on_table_dims = [0.2, 0.2, 0.1]
 
+function static_ramp!(client::Int64, slope::Float64,
+                      tableRampIntersection::Float64)
     # add a table base
     grey = [0.5, 0.5, 0.5, 1]
-    base_dims = [5, 1, 0.75] # in meters
     table_dims = [base_dims[1] + 0.2, base_dims[2] + 0.2, 0.1]  # Width, depth, height
     table_base_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents = base_dims / 2, physicsClientId = client)
     table_base_obj_id = pb.createMultiBody(baseCollisionShapeIndex = table_base_col_id, basePosition = [0,0,-(base_dims[3]+table_dims[3])/2], physicsClientId = client)
@@ -29,8 +77,8 @@ function ramp(
     pb.changeVisualShape(table_base_obj_id, -1, rgbaColor=grey, physicsClientId=client)
 
     # Create the tabletop (a flat box)
-    table_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=table_dims/2)
-    table_body_id = pb.createMultiBody(baseCollisionShapeIndex=table_col_id, basePosition=[0, 0, -table_dims[3]/2])
+    table_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=table_dims/2, physicsClientId=client)
+    table_body_id = pb.createMultiBody(baseCollisionShapeIndex=table_col_id, basePosition=[0, 0, -table_dims[3]/2], physicsClientId=client)
     pb.changeDynamics(table_body_id, -1; mass = 0., restitution = 0.9, physicsClientId=client)
     pb.changeVisualShape(table_body_id, -1, rgbaColor=grey.+0.2, physicsClientId=client)
 
@@ -53,8 +101,8 @@ function ramp(
     ]
 
     for (dims, pos) in zip(frame_dims, frame_positions)
-        frame_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=dims/2)::Int64
-        frame_obj_id = pb.createMultiBody(baseCollisionShapeIndex=frame_col_id, basePosition=pos)::Int64
+        frame_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=dims/2, physicsClientId=client)::Int64
+        frame_obj_id = pb.createMultiBody(baseCollisionShapeIndex=frame_col_id, basePosition=pos, physicsClientId=client)::Int64
         pb.changeVisualShape(frame_obj_id, -1, rgbaColor=grey, physicsClientId=client)
     end
 
@@ -85,28 +133,63 @@ function ramp(
         pb.changeDynamics(wall_obj_id, -1; mass=0.0, restitution=0.9, physicsClientId=client)
         pb.changeVisualShape(wall_obj_id, -1, rgbaColor=grey+[0.2, 0.2, 0.2, 0], physicsClientId=client)
     end
+    return nothing
+end
+
+"""
+$(TYPEDSIGNATURES)
 
-    # add an object on the ramp
-    obj_ramp_dims = [0.15, 0.3, 0.075]
+Places the two dynamic objects of a scene in `world` and snapshots it.
+
+The objects are created on the first call; later calls only reset their
+pose, velocity and dynamics. Returns `(client, a, b)` as `ramp`.
+"""
+function ramp!(world::RampWorld,
+               mass_ratio::Float64,
+               obj_frictions::NTuple{2, Float64} = (.5, .5),
+               obj_positions::NTuple{2, Float64} = (0.5, 1.5))
+    client = world.client
+    slope = world.slope
+
+    # object on the ramp
     theta_radians = -atan(slope)
     orientation = [cos(theta_radians / 2), 0, sin(theta_radians / 2), 0]
-
-    obj_on_ramp_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=obj_ramp_dims/2, physicsClientId=client)
     lift = obj_ramp_dims[3]/2
     position = [
-        -2+2*obj_positions[1]+tableRampIntersection+lift*cos(theta_radians),
+        -2+2*obj_positions[1]+world.tableRampIntersection+lift*cos(theta_radians),
         0,
         (2-2*obj_positions[1])*slope-lift*sin(theta_radians)
     ]
-    obj_on_ramp_obj_id = pb.createMultiBody(baseCollisionShapeIndex=obj_on_ramp_col_id, basePosition=position, baseOrientation=orientation, physicsClientId=client)
-    pb.changeDynamics(obj_on_ramp_obj_id, -1; mass=mass_ratio, restitution=0.9, lateralFriction=obj_frictions[1], physicsClientId=client)
-    
-    # add an object on the table that will collide with the object on the ramp as that one slides down
-    obj_on_table_dims = [0.2, 0.2, 0.1]
-    obj_on_table_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=obj_on_table_dims/2, physicsClientId=client)
-    obj_on_table_obj_id = pb.createMultiBody(baseCollisionShapeIndex=obj_on_table_col_id, basePosition=[2.5*(obj_positions[2]-1), 0, obj_on_table_dims[3]/2], physicsClientId=client)
-    pb.changeDynamics(obj_on_table_obj_id, -1; mass=1.0, restitution=0.9, lateralFriction=obj_frictions[2], physicsClientId=client)
-
-    (client, obj_on_ramp_obj_id, obj_on_table_obj_id)
+    # object on the table that will collide with the object on the ramp as that one slides down
+    table_position = [2.5*(obj_positions[2]-1), 0, obj_on_table_dims[3]/2]
+
+    if world.a < 0
+        obj_on_ramp_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=obj_ramp_dims/2, physicsClientId=client)
+        world.a = pb.createMultiBody(baseCollisionShapeIndex=obj_on_ramp_col_id, basePosition=position, baseOrientation=orientation, physicsClientId=client)
+        obj_on_table_col_id = pb.createCollisionShape(pb.GEOM_BOX, halfExtents=obj_on_table_dims/2, physicsClientId=client)
+        world.b = pb.createMultiBody(baseCollisionShapeIndex=obj_on_table_col_id, basePosition=table_position, physicsClientId=client)
+    else
+        pb.resetBasePositionAndOrientation(world.a, position, orientation; physicsClientId=client)
+        pb.resetBasePositionAndOrientation(world.b, table_position, [0, 0, 0, 1]; physicsClientId=client)
+        for obj in (world.a, world.b)
+            pb.resetBaseVelocity(obj, [0, 0, 0], [0, 0, 0]; physicsClientId=client)
+        end
+    end
+    pb.changeDynamics(world.a, -1; mass=mass_ratio, restitution=0.9, lateralFriction=obj_frictions[1], physicsClientId=client)
+    pb.changeDynamics(world.b, -1; mass=1.0, restitution=0.9, lateralFriction=obj_frictions[2], physicsClientId=client)
+
+    world.state >= 0 && pb.removeState(world.state; physicsClientId=client)
+    world.state = pb.saveState(; physicsClientId=client)
+    (client, world.a, world.b)
 end
 
+"""
+$(TYPEDSIGNATURES)
+
+Restores the scene last placed by `ramp!` (ie. for particle filter restarts).
+"""
+function reset_ramp!(world::RampWorld)
+    world.state < 0 && error("No scene placed in the world")
+    pb.restoreState(world.state; physicsClientId=world.client)
+    return nothing
+end
@@ -36,6 +36,20 @@ function update_test()
     return pos1, pos2
 end
 
+function pooled_test()
+    world = RampWorld()
+    client, a, b = ramp!(world, mass_ratio, obj_frictions, obj_positions)
+    mc_params = MCParams(client, [a,b], mprior, pprior, obs_noise)
+    trace, _ = Gen.generate(mc_gm, (t, mc_params))
+
+    # same bodies are reused for the next scene
+    client2, a2, b2 = ramp!(world, 2 * mass_ratio, obj_frictions, (0.3, 1.2))
+    @assert (client2, a2, b2) == (client, a, b)
+    reset_ramp!(world)
+    mc_params = MCParams(client, [a,b], mprior, pprior, obs_noise)
+    trace, _ = Gen.generate(mc_gm, (t, mc_params))
+end
 
 forward_test()
-update_test()
\ No newline at end of file
+update_test()
+pooled_test()
\ No newline at end of file
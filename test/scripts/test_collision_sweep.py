@@ -0,0 +1,39 @@
+""" Tests of collision onsets in the ramp collision sweep """
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'scripts'))
+import repo_paths
+import ramp_physics
+import collision_sweep
+from collisions import FRAME_MS, onsets, collision_delta
+
+def test_onsets_count_rising_edges():
+    # two impacts lasting three frames each
+    contacts = np.zeros((20, 1), dtype = bool)
+    contacts[4:7] = True
+    contacts[12:15] = True
+    assert onsets(contacts, 2).tolist() == [4, 5]
+    assert onsets(contacts, 2, edges = True).tolist() == [4, 12]
+    assert collision_delta(contacts, edges = True) == 8 * FRAME_MS
+
+def test_nth_contact_waits_for_second_onset():
+    state = {'contacts' : np.zeros((20, 1), dtype = bool)}
+    state['contacts'][4:7] = True
+    _, test = ramp_physics.nth_contact(2)
+    assert not any(test(state, t) for t in range(12))
+    state['contacts'][12] = True
+    assert test(state, 12)
+
+def test_sweep_duration_spans_more_than_a_frame():
+    collision_sweep._init_worker()
+    point = {'position' : 0.5, 'density_ratio' : 4.0, 'friction' : 0.2,
+             'shape' : 'Block', 'table_position' : 1.2}
+    row = collision_sweep.run_point(point)
+    assert row['second'] > row['first'] + 1
+    assert row['duration'] > FRAME_MS
+    # stops on the second onset
+    assert row['frames'] == row['second'] + 1
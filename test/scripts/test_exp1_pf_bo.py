@@ -0,0 +1,118 @@
+""" Tests of the dask setup and search loops of `exp1_pf_bo.py` """
+import os
+import sys
+import time
+import types
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'scripts'))
+import repo_paths
+import exp1_pf_bo
+
+class Runtime:
+
+    """ Records evaluations in place of the julia runtime """
+
+    def __init__(self):
+        self.evaluations = []
+        self.seeds = []
+
+    def evaluation(self, obs_noise, particles, dataset, trial, reps = 1):
+        self.evaluations.append(trial)
+        return {'trial' : trial, 'seed' : self.seeds[-1]}
+
+    def merge_evaluation(self, results, responses):
+        return float(len(results))
+
+@pytest.fixture
+def julia(monkeypatch):
+    """ Replaces `galileo_ramp.execute` and julia's `Random`, which are
+    not needed to set up the cluster """
+    runtime = Runtime()
+    runtime.initialized = []
+    def initialize(init = True):
+        runtime.initialized.append(init)
+        return runtime
+    execute = types.ModuleType('galileo_ramp.execute')
+    execute.initialize = initialize
+    package = types.ModuleType('galileo_ramp')
+    package.execute = execute
+    random = types.SimpleNamespace(seed_b = runtime.seeds.append)
+    monkeypatch.setitem(sys.modules, 'galileo_ramp', package)
+    monkeypatch.setitem(sys.modules, 'galileo_ramp.execute', execute)
+    monkeypatch.setitem(sys.modules, 'julia',
+                        types.SimpleNamespace(Random = random))
+    return runtime
+
+@pytest.fixture
+def client(julia):
+    client = exp1_pf_bo.initialize_dask(1, local = True, warmup = False,
+                                        in_process = True)
+    yield client
+    client.close()
+
+def test_in_process_local_cluster(julia, client):
+    runtimes = client.run(lambda dask_worker: dask_worker.galileo)
+    assert list(runtimes.values()) == [julia]
+    # initialized globally, then attached to the worker
+    assert julia.initialized == [True, False]
+    assert client.submit(exp1_pf_bo.runtime).result() is julia
+
+def wait_for(test, timeout = 10.):
+    t_0 = time.time()
+    while not test() and time.time() - t_0 < timeout:
+        time.sleep(0.05)
+    return test()
+
+def test_cache_is_written_by_the_client(julia, client, tmp_path):
+    cache = exp1_pf_bo.ResultCache(str(tmp_path / 'cache.sqlite'))
+    version = {'dataset' : 'test', 'code' : 'test'}
+    run = lambda seed: exp1_pf_bo.submit(0.01, 10, client, 1,
+                                         subset = [0, 1], cache = cache,
+                                         version = version,
+                                         seed = seed).result()
+    assert run(0) == -2.0
+    # stored by callbacks on the client
+    assert wait_for(lambda: len(cache) == 2)
+    assert run(0) == -2.0
+    assert julia.evaluations == [0, 1]
+    # another base seed is a new repeat of each trial
+    run(1)
+    assert wait_for(lambda: len(cache) == 4)
+    assert sorted(julia.evaluations) == [0, 0, 1, 1]
+    assert len(set(julia.seeds)) == 4
+
+def test_suggest_skips_duplicate_pending_points():
+    pbounds = {'obs_noise' : (0.001, 0.05)}
+    optimizer = exp1_pf_bo.BayesianOptimization(f = None, pbounds = pbounds,
+                                                verbose = 0, random_state = 1)
+    optimizer.register(params = {'obs_noise' : 0.01}, target = -1.0)
+    optimizer.register(params = {'obs_noise' : 0.02}, target = -2.0)
+    utility = exp1_pf_bo.UtilityFunction(kind = 'ucb', kappa = 2.576)
+    pending = [{'obs_noise' : 0.01}, {'obs_noise' : 0.03},
+               {'obs_noise' : 0.03}]
+    params = exp1_pf_bo.suggest(optimizer, pbounds, utility, pending, 0)
+    assert 0.001 <= params['obs_noise'] <= 0.05
+
+class Done:
+
+    """ A finished future """
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+def test_hyperband_skips_repeated_configurations(monkeypatch):
+    optimizer = exp1_pf_bo.BayesianOptimization(
+        f = None, pbounds = {'obs_noise' : (0.001, 0.05)}, verbose = 0)
+    # every bracket samples the same configuration
+    monkeypatch.setattr(optimizer.space, 'random_sample',
+                        lambda: np.array([0.01]))
+    evaluate = lambda params, budget: Done(-params['obs_noise'])
+    exp1_pf_bo.hyperband(optimizer, evaluate, n_rungs = 2, eta = 2)
+    assert len(optimizer.res) == 1
@@ -0,0 +1,39 @@
+""" Tests that batched ramp scenes do not interact """
+import os
+import sys
+
+import numpy as np
+import pybullet as pb
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'scripts'))
+import repo_paths
+import ramp_physics
+
+def scene_of(objs):
+    """ Maps body ids to their scene (-1 for the shared floor).
+
+    `ramp_batch` adds the floor first and then the bodies of each scene
+    in turn, ending with its objects.
+    """
+    return lambda body: -1 if body == 0 else \
+        int(np.searchsorted(objs[:, -1], body))
+
+@pytest.mark.parametrize('spacing', [10., 0.5])
+def test_no_contacts_across_scenes(spacing):
+    client = ramp_physics.init_client()
+    scenes = [{'density_ratio' : d, 'frictions' : (0.2, 0.2),
+               'positions' : (p, 1.2)}
+              for p in [0.3, 0.5, 0.7] for d in [1.0, 4.0]]
+    objs, offsets = ramp_physics.ramp_batch(client, scenes,
+                                            spacing = spacing)
+    owner = scene_of(objs)
+    crossed = 0
+    for _ in range(300):
+        ramp_physics.simulate_batch(client, objs, offsets, 1)
+        for c in pb.getContactPoints(physicsClientId = client):
+            a, b = owner(c[1]), owner(c[2])
+            crossed += a >= 0 and b >= 0 and a != b
+    pb.disconnect(physicsClientId = client)
+    assert crossed == 0
@@ -0,0 +1,24 @@
+""" Tests of the corpus-wide trace measures """
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'scripts'))
+import repo_paths
+import trace_compare
+
+def test_best_lag_skips_lags_without_overlap():
+    rng = np.random.default_rng(0)
+    long = np.cumsum(rng.normal(size = (40, 2, 3)), axis = 0)
+    # a 3 frame legacy trace only overlaps lags within 3 frames
+    legacy, _ = trace_compare.stack([long[:3], long[:40]])
+    current, _ = trace_compare.stack([long[:40], long[:40]])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        lag, err = trace_compare.best_lag(legacy, current, max_lag = 10)
+    assert lag.tolist() == [0, 0]
+    assert np.all(np.isfinite(err))
+    assert np.allclose(err, 0)